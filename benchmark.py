@@ -0,0 +1,324 @@
+"""
+Benchmark suite for the extraction pipeline.
+
+Generates a synthetic PDF corpus with PyMuPDF (controlled page counts, fonts,
+heading density and lines per page), then times each stage separately:
+    extract   pdf_processor.extract_text_with_layout
+    extract_lean  the same with lean=True (no image blocks, bold from span flags)
+    levels    heading_extractor.assign_levels
+    title     heading_extractor.extract_title
+    end_to_end main.extract_outline (what process_pdf runs)
+
+For every scenario it reports p50/p95 latency per document, throughput
+(documents and pages per second) and peak RSS. Each scenario runs in a fresh
+process so peak RSS is not inflated by earlier scenarios.
+
+Results can be saved as a JSON baseline and later runs compared against it;
+the comparison exits with status 1 when a metric regresses by more than the
+threshold.
+
+Usage:
+    python benchmark.py [--quick] [--save-baseline benchmarks.json]
+    python benchmark.py --compare benchmarks.json [--threshold 0.15]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# name: pages per document, body lines per page, share of lines that are headings,
+# number of distinct body fonts, documents in the corpus, images per page,
+# whether the headings are also stored as PDF bookmarks
+SCENARIOS = {
+    "small": {"pages": 5, "lines_per_page": 40, "heading_density": 0.05, "fonts": 2, "documents": 8},
+    "medium": {"pages": 50, "lines_per_page": 45, "heading_density": 0.05, "fonts": 2, "documents": 3},
+    "large": {"pages": 300, "lines_per_page": 45, "heading_density": 0.03, "fonts": 3, "documents": 1},
+    "dense_headings": {"pages": 20, "lines_per_page": 40, "heading_density": 0.3, "fonts": 2, "documents": 3},
+    "many_fonts": {"pages": 20, "lines_per_page": 60, "heading_density": 0.05, "fonts": 8, "documents": 3},
+    "brochure": {"pages": 8, "lines_per_page": 12, "heading_density": 0.15, "fonts": 2, "documents": 3, "images": 3},
+    "bookmarked": {"pages": 50, "lines_per_page": 45, "heading_density": 0.05, "fonts": 2, "documents": 3, "toc": True},
+}
+
+QUICK_SCENARIOS = ("small", "medium", "dense_headings", "brochure")
+
+STAGES = ("extract", "extract_lean", "levels", "title", "end_to_end")
+
+# Base-14 fonts: (regular, bold)
+FONT_PAIRS = [("helv", "hebo"), ("tiro", "tibo"), ("cour", "cobo")]
+
+WORDS = (
+    "analysis system process model data report section result method value design review "
+    "project market policy service quality budget summary overview requirement testing "
+    "performance architecture document outline structure content layout training"
+).split()
+
+
+def _photo(fitz, rng: random.Random, width: int = 640, height: int = 480):
+    # Smooth colour gradient plus noise, stored as a JPEG like a brochure photo
+    ys, xs = np.mgrid[0:height, 0:width]
+    noise = np.random.default_rng(rng.randrange(1 << 30)).integers(0, 40, (height, width, 3))
+    pixels = np.stack([xs * 255 // width, ys * 255 // height, (xs + ys) * 255 // (width + height)], axis=-1)
+    samples = ((pixels + noise) % 256).astype(np.uint8).tobytes()
+    return fitz.Pixmap(fitz.csRGB, width, height, samples, False).tobytes("jpeg")
+
+
+def generate_pdf(path: str, pages: int, lines_per_page: int, heading_density: float, fonts: int, seed: int = 0,
+                 images: int = 0, toc: bool = False):
+    """Write a synthetic PDF with numbered headings, body text and optionally images and bookmarks."""
+    import fitz # PyMuPDF
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    section = [0, 0, 0]
+    bookmarks = []
+    photos = [_photo(fitz, rng) for _ in range(images)]
+    for page_num in range(pages):
+        page = doc.new_page(width=595, height=842)
+        for index, photo in enumerate(photos):
+            # Images are placed down the right-hand half of the page, beside the text
+            top = 60 + index * 250
+            page.insert_image(fitz.Rect(330, top, 560, top + 170), stream=photo)
+        y = 60.0
+        if page_num == 0:
+            page.insert_text((72, y), "Synthetic Benchmark Document " + str(seed), fontsize=22, fontname="hebo")
+            y += 40
+        for _ in range(lines_per_page):
+            if y > 800:
+                break
+            if rng.random() < heading_density:
+                level = rng.choice((0, 0, 1, 1, 2))
+                section[level] += 1
+                for deeper in range(level + 1, 3):
+                    section[deeper] = 0
+                number = ".".join(str(n) for n in section[:level + 1])
+                if level == 0:
+                    number += "."
+                title = " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 5)))
+                size = (16, 14, 12)[level]
+                page.insert_text((72, y + size), f"{number} {title}", fontsize=size, fontname="hebo")
+                # Bookmark levels may only go one deeper than the previous entry
+                depth = bookmarks[-1][0] + 1 if bookmarks else 1
+                bookmarks.append([min(level + 1, depth), f"{number} {title}", page_num + 1])
+                y += size + 10
+            else:
+                regular, bold = FONT_PAIRS[rng.randrange(min(fonts, len(FONT_PAIRS)))]
+                # Extra fonts beyond the base-14 families differ by size
+                size = 10 + (rng.randrange(fonts) // len(FONT_PAIRS)) * 0.5
+                text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14)))
+                page.insert_text((72, y + size), text, fontsize=size, fontname=bold if rng.random() < 0.03 else regular)
+                y += size + 6
+        page.insert_text((290, 820), str(page_num + 1), fontsize=9, fontname="helv")
+    if toc:
+        doc.set_toc(bookmarks)
+    doc.save(path)
+    doc.close()
+
+
+def generate_corpus(corpus_dir: str, name: str, scenario: dict) -> list[str]:
+    paths = []
+    for index in range(scenario["documents"]):
+        path = os.path.join(corpus_dir, f"{name}_{index:03d}.pdf")
+        if not os.path.exists(path):
+            generate_pdf(path, scenario["pages"], scenario["lines_per_page"], scenario["heading_density"],
+                         scenario["fonts"], seed=index, images=scenario.get("images", 0),
+                         toc=scenario.get("toc", False))
+        paths.append(path)
+    return paths
+
+
+def _percentiles(samples: list[float]) -> dict:
+    values = np.array(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def _peak_rss_mb() -> float:
+    # On Linux ru_maxrss carries over the parent's peak through fork+exec, so
+    # read this process's own high-water mark instead
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(pdf_paths: list[str], pages: int, repeat: int) -> dict:
+    """Time every stage on every document; runs inside a fresh process."""
+    from pdf_processor import extract_text_with_layout
+    from heading_extractor import assign_levels, extract_title, load_model
+    from main import extract_outline
+
+    # Warm up: load the model and touch every code path once
+    load_model()
+    extract_outline(pdf_paths[0])
+
+    samples = {stage: [] for stage in STAGES}
+    for _ in range(repeat):
+        for pdf_path in pdf_paths:
+            start = time.perf_counter()
+            lines = extract_text_with_layout(pdf_path)
+            samples["extract"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            extract_text_with_layout(pdf_path, lean=True)
+            samples["extract_lean"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            assign_levels(lines)
+            samples["levels"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            extract_title(lines)
+            samples["title"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            extract_outline(pdf_path)
+            samples["end_to_end"].append(time.perf_counter() - start)
+
+    end_to_end = sum(samples["end_to_end"])
+    documents = len(samples["end_to_end"])
+    return {
+        "documents": len(pdf_paths),
+        "pages_per_document": pages,
+        "stages": {stage: _percentiles(values) for stage, values in samples.items()},
+        "throughput": {
+            "docs_per_s": round(documents / end_to_end, 3),
+            "pages_per_s": round(documents * pages / end_to_end, 1),
+        },
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_benchmarks(scenario_names, corpus_dir: str, repeat: int) -> dict:
+    import fitz # PyMuPDF
+
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pymupdf": fitz.VersionBind,
+            "repeat": repeat,
+        },
+        "scenarios": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    for name in scenario_names:
+        scenario = SCENARIOS[name]
+        print(f"Generating {name} corpus...", flush=True)
+        pdf_paths = generate_corpus(corpus_dir, name, scenario)
+        print(f"Running {name} ({scenario['documents']} x {scenario['pages']} pages)...", flush=True)
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            results["scenarios"][name] = pool.apply(run_scenario, (pdf_paths, scenario["pages"], repeat))
+    return results
+
+
+def print_results(results: dict):
+    print(f"\n{'scenario':<16} {'stage':<13} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, scenario in results["scenarios"].items():
+        for stage, stats in scenario["stages"].items():
+            print(f"{name:<16} {stage:<13} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f}")
+        throughput = scenario["throughput"]
+        print(f"{name:<16} {throughput['docs_per_s']:.2f} docs/s, {throughput['pages_per_s']:.1f} pages/s, "
+              f"peak RSS {scenario['peak_rss_mb']:.1f} MB")
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list[str]:
+    """Return a description of every metric that is worse than the baseline by more than threshold."""
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        for stage, stats in scenario["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if base_stats is None:
+                continue
+            for metric in ("p50_ms", "p95_ms"):
+                current, previous = stats[metric], base_stats[metric]
+                # Ignore sub-millisecond changes; they are timer noise
+                if current > previous * (1 + threshold) and current - previous > min_delta_ms:
+                    regressions.append(f"{name}/{stage} {metric}: {previous:.2f} -> {current:.2f}")
+        for metric in ("docs_per_s", "pages_per_s"):
+            current, previous = scenario["throughput"][metric], base["throughput"][metric]
+            if current < previous / (1 + threshold):
+                regressions.append(f"{name} {metric}: {previous:.2f} -> {current:.2f}")
+        if scenario["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{name} peak_rss_mb: {base['peak_rss_mb']:.1f} -> {scenario['peak_rss_mb']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PDF outline extraction pipeline.")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=None,
+                        help="Scenarios to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help=f"Only run {', '.join(QUICK_SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over each corpus (default: 3)")
+    parser.add_argument("--corpus-dir", default=None,
+                        help="Keep the generated PDFs here and reuse them across runs (default: temporary)")
+    parser.add_argument("--save-baseline", default=None, help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", default=None, help="Compare against a JSON baseline and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown treated as a regression (default: 0.15)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="Ignore latency changes smaller than this (default: 1.0)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.scenarios:
+        scenario_names = args.scenarios
+    elif args.quick:
+        scenario_names = QUICK_SCENARIOS
+    elif baseline is not None:
+        scenario_names = [name for name in baseline["scenarios"] if name in SCENARIOS]
+    else:
+        scenario_names = list(SCENARIOS)
+
+    if args.corpus_dir:
+        os.makedirs(args.corpus_dir, exist_ok=True)
+        results = run_benchmarks(scenario_names, args.corpus_dir, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            results = run_benchmarks(scenario_names, corpus_dir, args.repeat)
+
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.compare}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.compare} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
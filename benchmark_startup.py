@@ -0,0 +1,105 @@
+"""
+Cold-start benchmark for the Docker entry point.
+
+Runs the same command as the Docker CMD (`python main.py input_dir output_dir`)
+in a fresh interpreter several times and reports:
+    interpreter: time to start and exit a bare `python -c pass`
+    import:      time to start python and import main (all runtime modules)
+    first:       time from launching main.py to the first complete JSON output
+    total:       time until main.py exits
+
+Usage:
+    python benchmark_startup.py [--input-dir input] [--runs 5] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _time_command(args: list[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(args, cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def _first_complete_output(output_dir: str) -> bool:
+    for name in os.listdir(output_dir):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(output_dir, name), "r", encoding="utf-8") as f:
+                json.load(f)
+            return True
+        except (OSError, ValueError):
+            # Still being written
+            continue
+    return False
+
+
+def time_main_run(input_dir: str, poll_interval: float = 0.002) -> tuple[float, float]:
+    """Run main.py once; return (seconds to first result, seconds to exit)."""
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "main.py", os.path.abspath(input_dir), output_dir],
+            cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        first_result = None
+        while process.poll() is None:
+            if first_result is None and _first_complete_output(output_dir):
+                first_result = time.perf_counter() - start
+            time.sleep(poll_interval)
+        total = time.perf_counter() - start
+        if process.returncode != 0:
+            raise RuntimeError(f"main.py exited with status {process.returncode}")
+        if first_result is None:
+            # Finished between two polls
+            first_result = total if _first_complete_output(output_dir) else float("nan")
+        return first_result, total
+
+
+def run_benchmark(input_dir: str, runs: int) -> dict:
+    samples = {"interpreter": [], "import": [], "first": [], "total": []}
+    for _ in range(runs):
+        samples["interpreter"].append(_time_command([sys.executable, "-c", "pass"]))
+        samples["import"].append(_time_command([sys.executable, "-c", "import main"]))
+        first, total = time_main_run(input_dir)
+        samples["first"].append(first)
+        samples["total"].append(total)
+
+    return {
+        name: {"median": statistics.median(values), "min": min(values), "max": max(values), "samples": values}
+        for name, values in samples.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start latency of main.py.")
+    parser.add_argument("--input-dir", default=os.path.join(REPO_DIR, "input"), help="Directory of PDFs to process")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold runs (default: 5)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.input_dir, args.runs)
+
+    print(f"Cold start over {args.runs} runs (seconds):")
+    print(f"{'stage':<12} {'median':>8} {'min':>8} {'max':>8}")
+    for name, stats in results.items():
+        print(f"{name:<12} {stats['median']:>8.3f} {stats['min']:>8.3f} {stats['max']:>8.3f}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import resource
+import sys
+import time
+
+import metrics
+from heading_extractor import assign_levels, extract_title
+from layout_cache import LayoutCache, cache_key
+from pdf_processor import extract_leading_pages
+
+# Degradation levels, least to most degraded; each output records the one used
+FULL = "full"
+PAGES_CAPPED = "pages_capped"
+HEURISTIC = "heuristic"
+TITLE_ONLY = "title_only"
+DEGRADATION_LEVELS = (FULL, PAGES_CAPPED, HEURISTIC, TITLE_ONLY)
+
+# Share of the budget at which extraction stops reading further pages
+EXTRACT_SHARE = 0.4
+# Share of the budget used after extraction from which levels come from the heuristics
+# instead of the model. It is above EXTRACT_SHARE, so a document whose extraction was cut
+# short keeps the model (pages_capped) unless the title page alone ran past this share.
+HEURISTIC_SHARE = 0.6
+
+
+def current_rss_mb() -> float:
+    # Resident set size of this process; falls back to the peak where /proc is not available
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Budget:
+    """
+    Per-document time and memory budget with graceful degradation.
+
+    seconds limits the wall time of a document and memory_mb the growth of the
+    process's resident memory while it is processed; max_pages caps the pages
+    analyzed. The share of the budget used is the larger of the two ratios.
+    A document that runs over degrades in stages: extraction stops reading
+    pages (pages_capped), levels come from the heuristics instead of the model
+    (heuristic), and finally only the title is returned (title_only).
+    """
+
+    def __init__(self, seconds: float | None = None, memory_mb: float | None = None, max_pages: int | None = None):
+        self.seconds = seconds
+        self.memory_mb = memory_mb
+        self.max_pages = max_pages
+
+    def __repr__(self):
+        return f"Budget(seconds={self.seconds}, memory_mb={self.memory_mb}, max_pages={self.max_pages})"
+
+    def start(self) -> "BudgetClock":
+        return BudgetClock(self)
+
+
+class BudgetClock:
+    """Tracks the budget of one document from the moment it is created."""
+
+    def __init__(self, budget: Budget):
+        self.budget = budget
+        self.start_time = time.perf_counter()
+        self.start_rss_mb = current_rss_mb() if budget.memory_mb else 0.0
+
+    def used(self) -> float:
+        """Share of the budget used so far (1.0 = exhausted)."""
+        used = 0.0
+        if self.budget.seconds:
+            used = (time.perf_counter() - self.start_time) / self.budget.seconds
+        if self.budget.memory_mb:
+            used = max(used, (current_rss_mb() - self.start_rss_mb) / self.budget.memory_mb)
+        return used
+
+
+def _extract(pdf_path: str | bytes, clock: BudgetClock, cache: LayoutCache | None, lean: bool):
+    # Leading pages of the document within the budget, and whether pages were left out
+    max_pages = clock.budget.max_pages
+    if cache is not None:
+        key = cache_key(pdf_path, lean)
+        table = cache.get(key)
+        if table is not None:
+            metrics.increment("layout_cache_hits")
+            capped = table.head_pages(max_pages) if max_pages else table
+            return capped, capped is not table
+        metrics.increment("layout_cache_misses")
+    table, page_count = extract_leading_pages(pdf_path, lean, max_pages,
+                                              should_stop=lambda: clock.used() >= EXTRACT_SHARE)
+    complete = table.page_count == page_count
+    if complete and cache is not None:
+        # Only whole documents are cached, so a capped run never shortens a later one
+        cache.put(key, table)
+    return table, not complete
+
+
+def budgeted_outline(pdf_path: str | bytes, budget: Budget, cache: LayoutCache | None = None, model=None,
+                     lean: bool = False) -> tuple[str, list[dict], str]:
+    # Title, outline and the degradation level used for one document
+    clock = budget.start()
+    table, capped = _extract(pdf_path, clock, cache, lean)
+    title = extract_title(table)
+    used = clock.used()
+    if used >= 1.0:
+        level, outline = TITLE_ONLY, []
+    elif used >= HEURISTIC_SHARE:
+        # model=False makes assign_levels take its heuristic path
+        level, outline = HEURISTIC, assign_levels(table, model=False)
+    else:
+        level, outline = PAGES_CAPPED if capped else FULL, assign_levels(table, model=model)
+    if level != FULL:
+        metrics.increment(f"degraded_{level}")
+    return title, outline, level
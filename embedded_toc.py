@@ -0,0 +1,101 @@
+import re
+
+import metrics
+from heading_extractor import clean_text, extract_title
+from pdf_processor import open_pdf, page_with_layout
+
+# A bookmarks outline is used instead of layout analysis only if it passes these checks
+MIN_TOC_ENTRIES = 2
+# Entries whose text is looked up on their target page (spread evenly over the TOC)
+TOC_SAMPLE_SIZE = 8
+# Share of the sampled entries that must be found on their target page
+TOC_MIN_MATCH = 0.8
+# Output levels stop at H3; deeper bookmarks are left out
+MAX_TOC_LEVEL = 3
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def _normalize(text: str) -> str:
+    # Case, whitespace and punctuation differ freely between bookmarks and page text
+    return _NON_WORD.sub("", text.casefold())
+
+
+def _drop_title_root(toc: list, title: str) -> list:
+    # Many documents put the document title as the single top-level bookmark with
+    # everything else below it; drop it and promote its children one level
+    top_level = [entry for entry in toc if entry[0] == 1]
+    if len(top_level) != 1 or toc[0] is not top_level[0] or _normalize(toc[0][1]) != _normalize(title):
+        return toc
+    return [[level - 1, text, page] for level, text, page in toc[1:]]
+
+
+def toc_is_usable(doc, toc: list) -> bool:
+    if len(toc) < MIN_TOC_ENTRIES:
+        return False
+    # Every entry must point at a page of this document
+    if any(not 1 <= page <= doc.page_count for _, _, page in toc):
+        return False
+    if len(toc) <= TOC_SAMPLE_SIZE:
+        sample = toc
+    else:
+        step = len(toc) / TOC_SAMPLE_SIZE
+        sample = [toc[int(i * step)] for i in range(TOC_SAMPLE_SIZE)]
+    page_texts = {}
+    matched = 0
+    for _, text, page in sample:
+        needle = _normalize(text)
+        if not needle:
+            continue
+        if page not in page_texts:
+            # Plain text without ligatures or whitespace preservation is all the check needs
+            page_texts[page] = _normalize(doc[page - 1].get_text("text", flags=0))
+        if needle in page_texts[page]:
+            matched += 1
+    return matched >= TOC_MIN_MATCH * len(sample)
+
+
+def toc_outline(pdf_path: str | bytes, lean: bool = False) -> dict | None:
+    # Title and outline from the document's embedded bookmarks, or None when it has
+    # no usable table of contents and the full layout pipeline has to run
+    with metrics.timer("open"):
+        doc = open_pdf(pdf_path)
+    with doc:
+        with metrics.timer("toc"):
+            toc = doc.get_toc(simple=True)
+        if not toc:
+            return None
+        with metrics.timer("toc"):
+            # Bookmarks without a destination (page -1) are left out rather than rejecting the TOC
+            toc = [entry for entry in toc if entry[2] >= 1]
+            usable = toc_is_usable(doc, toc)
+        if not usable:
+            metrics.increment("toc_rejected")
+            return None
+        # The title comes from the first page exactly as in the full pipeline. Its page
+        # metrics are kept apart until the TOC is accepted: a rejected document is
+        # extracted again from page 0 and would otherwise count that page twice.
+        title_page_metrics = metrics.Metrics()
+        title = extract_title(page_with_layout(doc, 0, lean, title_page_metrics))
+        toc = _drop_title_root(toc, title)
+    if len(toc) < MIN_TOC_ENTRIES:
+        metrics.increment("toc_rejected")
+        return None
+    outline = []
+    seen = set()
+    # In page order like assign_levels' output; entries on the same page keep their bookmark order
+    for level, text, page in sorted(toc, key=lambda entry: entry[2]):
+        text = clean_text(text)
+        if level > MAX_TOC_LEVEL or not text:
+            continue
+        item = {"level": f"H{level}", "text": text, "page": page - 1}
+        item_tuple = (item["level"], text, item["page"])
+        if item_tuple not in seen:
+            seen.add(item_tuple)
+            outline.append(item)
+    if not outline:
+        metrics.increment("toc_rejected")
+        return None
+    metrics.METRICS.merge(title_page_metrics.snapshot())
+    metrics.increment("toc_fast_path")
+    return {"title": title, "outline": outline}
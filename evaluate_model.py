@@ -1,14 +1,15 @@
 
 import os
 import json
-from pdf_processor import extract_text_with_layout
-from heading_extractor import extract_title, assign_levels, clean_text
+import argparse
+from heading_extractor import Prefilter, extract_title, assign_levels, clean_text, predict_headings
+from layout_cache import LayoutCache, extract_with_cache
 from sklearn.metrics import precision_score, recall_score, f1_score
 import numpy as np
 
-def evaluate_pdf(pdf_path, ground_truth_path):
-    extracted_data = extract_text_with_layout(pdf_path)
-    predicted_outline = assign_levels(extracted_data)
+def evaluate_pdf(pdf_path, ground_truth_path, cache=None, prefilter=None):
+    extracted_data = extract_with_cache(pdf_path, cache)
+    predicted_outline = assign_levels(extracted_data, prefilter=prefilter)
     predicted_title = extract_title(extracted_data)
 
     with open(ground_truth_path, "r", encoding="utf-8") as f:
@@ -78,7 +79,7 @@ def evaluate_pdf(pdf_path, ground_truth_path):
 
     return overall_precision, overall_recall, overall_f1
 
-def evaluate_all_pdfs(pdf_dir, ground_truth_dir):
+def evaluate_all_pdfs(pdf_dir, ground_truth_dir, cache=None):
     all_precision = []
     all_recall = []
     all_f1 = []
@@ -94,7 +95,7 @@ def evaluate_all_pdfs(pdf_dir, ground_truth_dir):
             print(f"Warning: Ground truth JSON not found for {pdf_file}. Skipping evaluation.")
             continue
 
-        precision, recall, f1 = evaluate_pdf(pdf_path, ground_truth_path)
+        precision, recall, f1 = evaluate_pdf(pdf_path, ground_truth_path, cache)
         all_precision.append(precision)
         all_recall.append(recall)
         all_f1.append(f1)
@@ -111,10 +112,112 @@ def evaluate_all_pdfs(pdf_dir, ground_truth_dir):
 
     return avg_precision, avg_recall, avg_f1
 
+def audit_prefilter(pdf_dir, ground_truth_dir, prefilter, cache=None):
+    """
+    Measure what a heading_extractor.Prefilter saves and what it costs in accuracy.
+
+    Per PDF with a ground truth JSON, counts the lines the model still scores,
+    the lines the model marks as headings that the prefilter rejects, and the
+    ground truth headings whose line the prefilter rejects. A ground truth
+    heading matches a line with the same cleaned text within one page. Also
+    compares the evaluate_pdf scores with and without the prefilter.
+    """
+    totals = {"lines": 0, "scored": 0, "model_headings": 0, "model_headings_lost": 0,
+              "true_headings": 0, "true_headings_matched": 0, "true_headings_lost": 0}
+    f1_full = []
+    f1_prefiltered = []
+    recall_full = []
+    recall_prefiltered = []
+    for pdf_file in sorted(f for f in os.listdir(pdf_dir) if f.endswith(".pdf")):
+        pdf_path = os.path.join(pdf_dir, pdf_file)
+        ground_truth_path = os.path.join(ground_truth_dir, pdf_file.replace(".pdf", ".json"))
+        if not os.path.exists(ground_truth_path):
+            continue
+        table = extract_with_cache(pdf_path, cache)
+        if not table:
+            continue
+        keep = prefilter.mask(table)
+        model_headings = predict_headings(table) == 1
+
+        # Line indices by (cleaned text, page), to find the lines behind ground truth headings
+        lines_by_key = {}
+        for line_index, (text, page) in enumerate(zip(table.text, table.page.tolist())):
+            lines_by_key.setdefault((clean_text(text), page), []).append(line_index)
+        with open(ground_truth_path, "r", encoding="utf-8") as f:
+            true_outline = json.load(f).get("outline", [])
+        matched = lost = 0
+        for item in true_outline:
+            text = clean_text(item["text"])
+            line_indices = [i for page in (item["page"] - 1, item["page"], item["page"] + 1)
+                            for i in lines_by_key.get((text, page), [])]
+            if line_indices:
+                matched += 1
+                lost += not keep[line_indices].any()
+
+        totals["lines"] += len(table)
+        totals["scored"] += int(keep.sum())
+        totals["model_headings"] += int(model_headings.sum())
+        totals["model_headings_lost"] += int((model_headings & ~keep).sum())
+        totals["true_headings"] += len(true_outline)
+        totals["true_headings_matched"] += matched
+        totals["true_headings_lost"] += lost
+
+        _, recall, f1 = evaluate_pdf(pdf_path, ground_truth_path, cache)
+        _, recall_pre, f1_pre = evaluate_pdf(pdf_path, ground_truth_path, cache, prefilter)
+        recall_full.append(recall)
+        recall_prefiltered.append(recall_pre)
+        f1_full.append(f1)
+        f1_prefiltered.append(f1_pre)
+        print(f"{pdf_file}: scored {keep.sum()}/{len(table)} lines, "
+              f"lost {int((model_headings & ~keep).sum())}/{int(model_headings.sum())} model headings, "
+              f"{lost}/{matched} ground truth headings, F1 {f1:.4f} -> {f1_pre:.4f}")
+
+    def share(part, whole):
+        return part / whole if whole else 0.0
+
+    summary = {
+        "prefilter": repr(prefilter),
+        "lines_scored": share(totals["scored"], totals["lines"]),
+        "model_heading_recall": 1 - share(totals["model_headings_lost"], totals["model_headings"]),
+        "true_heading_recall": 1 - share(totals["true_headings_lost"], totals["true_headings_matched"]),
+        "true_headings_unmatched": totals["true_headings"] - totals["true_headings_matched"],
+        "recall": (float(np.mean(recall_full)) if recall_full else 0.0,
+                   float(np.mean(recall_prefiltered)) if recall_prefiltered else 0.0),
+        "f1": (float(np.mean(f1_full)) if f1_full else 0.0, float(np.mean(f1_prefiltered)) if f1_prefiltered else 0.0),
+    }
+    print(f"\n--- {summary['prefilter']} ---")
+    print(f"Lines scored by the model: {summary['lines_scored']:.1%}")
+    print(f"Model headings kept: {summary['model_heading_recall']:.1%} "
+          f"({totals['model_headings_lost']} of {totals['model_headings']} lost)")
+    print(f"Ground truth headings kept: {summary['true_heading_recall']:.1%} "
+          f"({totals['true_headings_lost']} of {totals['true_headings_matched']} lost, "
+          f"{summary['true_headings_unmatched']} not matched to a single line)")
+    print(f"Average recall: {summary['recall'][0]:.4f} -> {summary['recall'][1]:.4f}")
+    print(f"Average F1-Score: {summary['f1'][0]:.4f} -> {summary['f1'][1]:.4f}")
+    return summary
+
 if __name__ == "__main__":
-    pdf_directory = "/home/ubuntu/Adobe-India-Hackathon25/Challenge_1a/sample_dataset/pdfs"
-    ground_truth_directory = "/home/ubuntu/Adobe-India-Hackathon25/Challenge_1a/sample_dataset/outputs"
+    parser = argparse.ArgumentParser(description="Evaluate extracted outlines against ground truth JSON files.")
+    parser.add_argument("pdf_dir", nargs="?", default="/home/ubuntu/Adobe-India-Hackathon25/Challenge_1a/sample_dataset/pdfs")
+    parser.add_argument("ground_truth_dir", nargs="?",
+                        default="/home/ubuntu/Adobe-India-Hackathon25/Challenge_1a/sample_dataset/outputs")
+    parser.add_argument("--audit-prefilter", action="store_true",
+                        help="Report the speed/accuracy trade-off of the heading prefilter instead")
+    parser.add_argument("--size-ratio", type=float, nargs="+", default=[Prefilter().min_size_ratio],
+                        help="Prefilter min_size_ratio values to audit (several values compare settings)")
+    parser.add_argument("--no-bold", action="store_true", help="Audit without the bold rule")
+    parser.add_argument("--no-numbered", action="store_true", help="Audit without the numbering rule")
+    parser.add_argument("--max-chars", type=int, default=Prefilter().max_chars, help="Prefilter max_chars")
+    args = parser.parse_args()
     
-    evaluate_all_pdfs(pdf_directory, ground_truth_directory)
+    # Reuse extracted layouts across runs so iterating on assign_levels does not re-parse the PDFs
+    cache = LayoutCache()
+    if args.audit_prefilter:
+        for size_ratio in args.size_ratio:
+            prefilter = Prefilter(size_ratio, keep_bold=not args.no_bold, keep_numbered=not args.no_numbered,
+                                  max_chars=args.max_chars)
+            audit_prefilter(args.pdf_dir, args.ground_truth_dir, prefilter, cache)
+    else:
+        evaluate_all_pdfs(args.pdf_dir, args.ground_truth_dir, cache=cache)
 
 
@@ -1,22 +1,104 @@
 
+import hashlib
+import os
 import numpy as np
 import re
-import joblib
-import pandas as pd
-
-# Load the trained XGBoost model
-MODEL_PATH = "xgboost_heading_model.joblib"
-try:
-    XGB_MODEL = joblib.load(MODEL_PATH)
-except FileNotFoundError:
-    XGB_MODEL = None
+import metrics
+from line_table import LineTable
+
+# The trained model is loaded on first use, so importing this module stays cheap.
+# Preferred is the tree export evaluated by tree_engine (NumPy only), then XGBoost's
+# native UBJSON booster, then the pickled XGBClassifier. HEADING_MODEL_PATH selects
+# a single model file instead (format chosen by extension).
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINE_MODEL_PATH = os.path.join(MODEL_DIR, "xgboost_heading_model.npz")
+MODEL_PATH = os.path.join(MODEL_DIR, "xgboost_heading_model.ubj")
+LEGACY_MODEL_PATH = os.path.join(MODEL_DIR, "xgboost_heading_model.joblib")
+
+class BoosterModel:
+    # Thin wrapper around a native binary:logistic Booster with XGBClassifier.predict semantics
+    def __init__(self, booster):
+        self.booster = booster
+
+    def predict(self, feature_matrix: np.ndarray) -> np.ndarray:
+        return (self.booster.inplace_predict(feature_matrix) > 0.5).astype(np.int64)
+
+    def set_threads(self, n_threads: int):
+        self.booster.set_param({"nthread": n_threads})
+
+def best_booster(model):
+    # The booster of an XGBClassifier truncated to the early-stopping iteration, so it
+    # scores with exactly the trees XGBClassifier.predict uses
+    booster = model.get_booster()
+    best_iteration = getattr(booster, "best_iteration", None)
+    if best_iteration is None or best_iteration + 1 >= booster.num_boosted_rounds():
+        return booster
+    booster = booster[:best_iteration + 1]
+    booster.set_attr(best_iteration=None, best_score=None)
+    return booster
+
+_model = None
+_model_loaded = False
+
+def _load_model_file(path: str):
+    if path.endswith(".npz"):
+        from tree_engine import TreeEnsemble, TreeEngineModel
+        return TreeEngineModel(TreeEnsemble.load(path))
+    if path.endswith(".joblib"):
+        import joblib
+        return BoosterModel(best_booster(joblib.load(path)))
+    import xgboost
+    return BoosterModel(xgboost.Booster(model_file=path))
+
+def _model_file_path() -> str | None:
+    # The model file load_model() will use, or None when running on heuristics
+    override_path = os.environ.get("HEADING_MODEL_PATH")
+    candidates = [override_path] if override_path else [ENGINE_MODEL_PATH, MODEL_PATH, LEGACY_MODEL_PATH]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return None
+
+def _load_model_from_disk():
+    path = _model_file_path()
+    if path is not None:
+        return _load_model_file(path)
     print("Warning: XGBoost model not found. Running with heuristics only.")
+    metrics.increment("model_missing")
+    return None
+
+def model_version() -> str:
+    # Identifies the model that produced an outline, without loading it
+    path = _model_file_path()
+    if path is None:
+        return "heuristics"
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    return f"{os.path.basename(path)}:{digest.hexdigest()[:16]}"
+
+def load_model():
+    # Load the model on first use; None means heuristics only
+    global _model, _model_loaded
+    if not _model_loaded:
+        with metrics.timer("model_load"):
+            _model = _load_model_from_disk()
+        _model_loaded = True
+    return _model
+
+def set_model(model):
+    # Replace the model used by assign_levels (None forces the heuristic fallback)
+    global _model, _model_loaded
+    _model = model
+    _model_loaded = True
 
 def clean_text(t: str) -> str:
     # Only strip leading/trailing whitespace and standardize internal whitespace
     t = re.sub(r'\s+', ' ', t).strip()
     return t
 
+FEATURE_COLUMNS = ["font_size", "is_bold", "x0", "y0", "x1", "y1", "page_width", "page_height"]
+
 def extract_features_for_prediction(line: dict) -> list:
     return [
         line["font_size"],
@@ -29,134 +111,256 @@ def extract_features_for_prediction(line: dict) -> list:
         line["page_height"]
     ]
 
-def assign_levels(lines: list[dict]) -> list[dict]:
+def as_line_table(lines) -> LineTable:
+    # Accept either a LineTable or the older list-of-dicts format
+    if isinstance(lines, LineTable):
+        return lines
+    return LineTable.from_dicts(lines)
+
+def build_feature_matrix(lines) -> np.ndarray:
+    # One row per line, same column layout as extract_features_for_prediction
+    table = as_line_table(lines)
+    return np.column_stack([
+        table.font_size,
+        table.is_bold.astype(np.float64),
+        table.bbox,
+        table.page_width,
+        table.page_height
+    ]).reshape(len(table), len(FEATURE_COLUMNS))
+
+def predict_headings(lines, chunk_size: int | None = None, model=None, rows: np.ndarray | None = None) -> np.ndarray:
+    # Score every line with the model in a single call (or one call per chunk for very large documents).
+    # Any object with a predict(feature_matrix) method can stand in for the loaded model.
+    # With a boolean rows mask only those lines are scored, and one prediction is returned per selected line.
+    if model is None:
+        model = load_model()
+    with metrics.timer("features"):
+        feature_matrix = build_feature_matrix(lines)
+        if rows is not None:
+            feature_matrix = feature_matrix[rows]
+    with metrics.timer("inference"):
+        if not chunk_size or chunk_size >= len(feature_matrix):
+            return model.predict(feature_matrix)
+        return np.concatenate([
+            model.predict(feature_matrix[start:start + chunk_size])
+            for start in range(0, len(feature_matrix), chunk_size)
+        ])
+
+# Numbering and filter patterns used by assign_levels
+# A numbered line as the heuristics see it after clean_text: "1.2 Text", "3 Text"
+_NUMBERED_LINE = re.compile(r'\s*\d+(?:\.\d+)*\s+\S')
+_NUMBER_ONLY = re.compile(r'\d+(?:\.\d+)*$')
+_DIGIT_START = re.compile(r'\s*\d')
+_THREE_LETTERS = re.compile(r'[a-zA-Z]{3,}')
+# "1." -> H1, "1.2" -> H2, "1.2.3" -> H3, decided by which groups take part in the match
+_NUMBERING = re.compile(r'\d+\.(\d+(\.\d)?)?')
+_LEVELS = np.array(["H1", "H2", "H3"])
+
+def page_medians(pages: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Median of values for each distinct page (same result as np.median per page),
+    # from one sort instead of one boolean mask per page
+    order = np.lexsort((values, pages))
+    sorted_pages = pages[order]
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_pages[1:] != sorted_pages[:-1]])
+    counts = np.diff(np.r_[starts, len(sorted_pages)])
+    medians = (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+    return sorted_pages[starts], medians
+
+class Prefilter:
+    # First stage of a classifier cascade: cheap vectorized rules that reject clear body
+    # text, so the model only scores the remaining lines. A line is kept when it is at
+    # least min_size_ratio times its page's median font size, bold (keep_bold) or starts
+    # with a digit (keep_numbered), and is at most max_chars long. Rejected lines are
+    # treated as body text. Tune with `python evaluate_model.py --audit-prefilter`.
+    def __init__(self, min_size_ratio: float = 1.05, keep_bold: bool = True, keep_numbered: bool = True,
+                 max_chars: int = 200):
+        self.min_size_ratio = min_size_ratio
+        self.keep_bold = keep_bold
+        self.keep_numbered = keep_numbered
+        self.max_chars = max_chars
+
+    def __repr__(self):
+        return (f"Prefilter(min_size_ratio={self.min_size_ratio:g}, keep_bold={self.keep_bold}, "
+                f"keep_numbered={self.keep_numbered}, max_chars={self.max_chars})")
+
+    def mask(self, lines) -> np.ndarray:
+        table = as_line_table(lines)
+        median_pages, medians = page_medians(table.page, table.font_size)
+        page_median = medians[np.searchsorted(median_pages, table.page)]
+        keep = table.font_size >= page_median * self.min_size_ratio
+        if self.keep_bold:
+            keep |= table.is_bold.astype(bool, copy=False)
+        if self.keep_numbered:
+            texts = table.text
+            for line_index in np.flatnonzero(~keep).tolist():
+                if _DIGIT_START.match(texts[line_index]):
+                    keep[line_index] = True
+        keep &= np.fromiter(map(len, table.text), dtype=np.int64, count=len(table)) <= self.max_chars
+        return keep
+
+# Applied by assign_levels when no prefilter is passed; None scores every line
+_prefilter = None
+
+def set_prefilter(prefilter: Prefilter | None):
+    global _prefilter
+    _prefilter = prefilter
+
+def get_prefilter() -> Prefilter | None:
+    return _prefilter
+
+def _keep_candidate(text: str) -> bool:
+    # Filter out short, non-descriptive lines that might be false positives (like dates, page numbers, etc.)
+    # and lines with few letters, unless they are clearly numbered headings
+    if ' ' not in text:
+        return _NUMBER_ONLY.match(text) is not None
+    return _THREE_LETTERS.search(text) is not None or _NUMBER_ONLY.match(text) is not None
+
+@metrics.timer("levels")
+def assign_levels(lines, chunk_size: int | None = None, model=None, prefilter: Prefilter | None = None) -> list[dict]:
     if not lines:
         return []
 
-    lines_by_page = {}
-    for line in lines:
-        page_num = line["page"]
-        if page_num not in lines_by_page:
-            lines_by_page[page_num] = []
-        lines_by_page[page_num].append(line)
-
-    median_font_sizes = {}
-    for page_num, page_lines in lines_by_page.items():
-        font_sizes = [l["font_size"] for l in page_lines]
-        if font_sizes:
-            median_font_sizes[page_num] = np.median(font_sizes)
-        else:
-            median_font_sizes[page_num] = 0
-
-    potential_headings = []
-    for line in lines:
-        cleaned_line_text = clean_text(line["text"])
-        if not cleaned_line_text: # Skip empty or whitespace-only lines
-            continue
-
-        is_potential_heading = False
-
-        if XGB_MODEL:
-            features = extract_features_for_prediction(line)
-            feature_df = pd.DataFrame([features], columns=["font_size", "is_bold", "x0", "y0", "x1", "y1", "page_width", "page_height"])
-            prediction = XGB_MODEL.predict(feature_df)[0]
-            if prediction == 1:
-                is_potential_heading = True
-        else:
-            # Fallback to heuristics if model is not loaded
-            if line["is_bold"] and line["font_size"] >= median_font_sizes.get(line["page"], 0) * 1.2:
-                is_potential_heading = True
-            elif re.match(r'^\d+(\.\d+)*\s', cleaned_line_text):
-                is_potential_heading = True
-            elif line["font_size"] > median_font_sizes.get(line["page"], 0) * 1.5:
-                is_potential_heading = True
-
-        # Filter out short, non-descriptive lines that might be false positives (like dates, page numbers, etc.)
-        # Also filter out lines that are mostly numbers or symbols unless they are clearly numbered headings
-        if is_potential_heading:
-            # Heuristic to filter out short, non-descriptive lines that are not numbered headings
-            if len(cleaned_line_text.split()) < 2 and not re.match(r'^\d+(\.\d+)*$', cleaned_line_text):
-                is_potential_heading = False
-            # Further filter out lines that are purely numeric or contain only a few alphabets and many non-alphanumeric chars
-            elif not re.search(r'[a-zA-Z]{3,}', cleaned_line_text) and not re.match(r'^\d+(\.\d+)*$', cleaned_line_text):
-                is_potential_heading = False
-
-        if is_potential_heading:
-            potential_headings.append(line)
-
-    # Sort potential headings by font size (descending) and then by page and bbox for original order
-    potential_headings.sort(key=lambda x: (-x["font_size"], x["page"], x["bbox"][1]))
-
-    # Group potential headings by page and then by font size to determine hierarchy
-    grouped_by_page_and_font = {}
-    for ph in potential_headings:
-        page_key = ph["page"]
-        font_size_key = ph["font_size"]
-        if page_key not in grouped_by_page_and_font:
-            grouped_by_page_and_font[page_key] = {}
-        if font_size_key not in grouped_by_page_and_font[page_key]:
-            grouped_by_page_and_font[page_key][font_size_key] = []
-        grouped_by_page_and_font[page_key][font_size_key].append(ph)
-
-    outline = []
-    for page_num in sorted(grouped_by_page_and_font.keys()):
-        font_sizes_on_page = sorted(grouped_by_page_and_font[page_num].keys(), reverse=True)
-        
-        size_to_level_on_page = {}
-        if len(font_sizes_on_page) >= 1: size_to_level_on_page[font_sizes_on_page[0]] = "H1"
-        if len(font_sizes_on_page) >= 2: size_to_level_on_page[font_sizes_on_page[1]] = "H2"
-        if len(font_sizes_on_page) >= 3: size_to_level_on_page[font_sizes_on_page[2]] = "H3"
-
-        for font_size in font_sizes_on_page:
-            for h in grouped_by_page_and_font[page_num][font_size]:
-                cleaned_text_h = clean_text(h["text"])
-                
-                lvl = size_to_level_on_page.get(h["font_size"], "H3") # Default level
-
-                # Override level assignment based on numbering patterns for more accuracy
-                if re.match(r'^\d+\.\d+\.\d+', cleaned_text_h):
-                    lvl = "H3"
-                elif re.match(r'^\d+\.\d+', cleaned_text_h):
-                    lvl = "H2"
-                elif re.match(r'^\d+\.', cleaned_text_h):
-                    lvl = "H1"
-                
-                outline.append({"level": lvl, "text": cleaned_text_h, "page": h["page"], "bbox": h["bbox"]})
-
-    # Remove duplicates based on level, text, and page, then sort by page and y-coordinate
+    table = as_line_table(lines)
+    font_size = table.font_size
+    page = table.page
+
+    # Classify all lines in one batch; predictions are per-row so this matches line-by-line scoring
+    if model is None:
+        model = load_model()
+    if prefilter is None:
+        prefilter = _prefilter
+    if model and prefilter is not None:
+        # Cascade: only lines that pass the prefilter are scored
+        rows = prefilter.mask(table)
+        metrics.increment("prefilter_rejected", len(table) - int(rows.sum()))
+        is_candidate = np.zeros(len(table), dtype=bool)
+        if rows.any():
+            is_candidate[rows] = predict_headings(table, chunk_size, model, rows) == 1
+    elif model:
+        is_candidate = predict_headings(table, chunk_size, model) == 1
+    else:
+        metrics.increment("heuristic_fallbacks")
+        # Fallback to heuristics if model is not loaded
+        median_pages, medians = page_medians(page, font_size)
+        page_median = medians[np.searchsorted(median_pages, page)]
+        is_bold = table.is_bold.astype(bool, copy=False)
+        is_candidate = (is_bold & (font_size >= page_median * 1.2)) | (font_size > page_median * 1.5)
+        texts = table.text
+        for line_index in np.flatnonzero(~is_candidate).tolist():
+            if _NUMBERED_LINE.match(texts[line_index]):
+                is_candidate[line_index] = True
+
+    # Text checks only run on the few candidate lines
+    candidates = []
+    cleaned_texts = []
+    for line_index in np.flatnonzero(is_candidate).tolist():
+        cleaned_line_text = clean_text(table.text[line_index])
+        if cleaned_line_text and _keep_candidate(cleaned_line_text):
+            candidates.append(line_index)
+            cleaned_texts.append(cleaned_line_text)
+    metrics.increment("candidates", len(candidates))
+    if not candidates:
+        return []
+
+    candidates = np.array(candidates)
+    sizes = font_size[candidates]
+    pages = page[candidates]
+    y0s = table.bbox[candidates, 1]
+
+    # Rank the distinct font sizes on each page, largest first: the top three are H1-H3,
+    # anything smaller H3
+    by_page_size = np.lexsort((-sizes, pages))
+    new_size = np.r_[True, (pages[by_page_size][1:] != pages[by_page_size][:-1])
+                     | (sizes[by_page_size][1:] != sizes[by_page_size][:-1])]
+    new_page = np.r_[True, pages[by_page_size][1:] != pages[by_page_size][:-1]]
+    size_number = np.cumsum(new_size)
+    size_rank = np.empty(len(candidates), dtype=np.int64)
+    size_rank[by_page_size] = size_number - np.maximum.accumulate(np.where(new_page, size_number, 0))
+    levels = np.minimum(size_rank, 2)
+
+    # Numbering patterns override the size-based level
+    for position, text in enumerate(cleaned_texts):
+        numbering = _NUMBERING.match(text)
+        if numbering is not None:
+            levels[position] = 0 if numbering.group(1) is None else 1 if numbering.group(2) is None else 2
+
+    # Walk the headings page by page, largest size first, then top to bottom; a repeated
+    # (level, text, page) keeps its first position in that order
+    order = np.lexsort((y0s, -sizes, pages)).tolist()
+    level_names = _LEVELS[levels].tolist()
+    pages_list = pages.tolist()
     seen_tuples = set()
-    final_outline = []
-    for item in outline:
-        item_tuple = (item["level"], item["text"], item["page"])
+    kept = []
+    for position in order:
+        item_tuple = (level_names[position], cleaned_texts[position], pages_list[position])
         if item_tuple not in seen_tuples:
-            final_outline.append(item)
             seen_tuples.add(item_tuple)
-    
-    final_outline.sort(key=lambda x: (x["page"], x["bbox"][1])) 
+            kept.append(position)
+
+    # Sort by page and y-coordinate; ties keep the order above
+    kept = np.array(kept)
+    kept = kept[np.lexsort((y0s[kept], pages[kept]))].tolist()
+    bboxes = table.bbox[candidates].tolist()
+    return [
+        {"level": level_names[k], "text": cleaned_texts[k], "page": pages_list[k], "bbox": tuple(bboxes[k])}
+        for k in kept
+    ]
+
+# Lines buffered by iter_outline before a batch of pages is classified
+STREAM_BATCH_LINES = 4096
 
-    return final_outline
+def iter_outline(page_tables, batch_lines: int = STREAM_BATCH_LINES, chunk_size: int | None = None, model=None):
+    # Streaming assign_levels: consume LineTables covering consecutive pages (e.g. from
+    # pdf_processor.iter_pages_with_layout) and yield outline entries as pages are classified.
+    # Medians, level assignment and sorting are all per page, so classifying a few pages
+    # at a time gives the same outline as assign_levels on the whole document.
+    seen_tuples = set()
+    pending_tables = []
+    pending_lines = 0
 
-def extract_title(lines: list[dict]) -> str:
+    def flush():
+        batch = pending_tables[0] if len(pending_tables) == 1 else LineTable.concat(pending_tables)
+        for item in assign_levels(batch, chunk_size, model):
+            item_tuple = (item["level"], item["text"], item["page"])
+            if item_tuple not in seen_tuples:
+                seen_tuples.add(item_tuple)
+                yield item
+
+    for table in page_tables:
+        pending_tables.append(table)
+        pending_lines += len(table)
+        if pending_lines >= batch_lines:
+            yield from flush()
+            pending_tables = []
+            pending_lines = 0
+    if pending_tables:
+        yield from flush()
+
+@metrics.timer("title")
+def extract_title(lines) -> str:
     if not lines:
         return ""
 
-    first_page_lines = [l for l in lines if l["page"] == 0]
-    if not first_page_lines:
+    table = as_line_table(lines)
+    first_page_indices = np.flatnonzero(table.page == 0)
+    if len(first_page_indices) == 0:
         return ""
 
-    first_page_lines.sort(key=lambda x: (-x["font_size"], x["bbox"][1]))
-
-    if first_page_lines:
-        candidate_title = first_page_lines[0]
-        cleaned_title_text = clean_text(candidate_title["text"])
-        
-        if len(cleaned_title_text.split()) > 2 and not re.match(r'^\d+(\.\d+)*\s*$', cleaned_title_text):
-            return cleaned_title_text
-        
-        for line in first_page_lines[1:]:
-            cleaned_line_text = clean_text(line["text"])
-            if len(cleaned_line_text.split()) > 2 and not re.match(r'^\d+(\.\d+)*\s*$', cleaned_line_text):
-                return cleaned_line_text
+    # Stable sort by font size (descending), then by y-coordinate
+    order = np.lexsort((table.bbox[first_page_indices, 1], -table.font_size[first_page_indices]))
+    first_page_texts = [table.text[i] for i in first_page_indices[order].tolist()]
+
+    candidate_title = first_page_texts[0]
+    cleaned_title_text = clean_text(candidate_title)
+    
+    if len(cleaned_title_text.split()) > 2 and not re.match(r'^\d+(\.\d+)*\s*$', cleaned_title_text):
+        return cleaned_title_text
+    
+    for line_text in first_page_texts[1:]:
+        cleaned_line_text = clean_text(line_text)
+        if len(cleaned_line_text.split()) > 2 and not re.match(r'^\d+(\.\d+)*\s*$', cleaned_line_text):
+            return cleaned_line_text
 
     return ""
 
@@ -0,0 +1,237 @@
+import os
+import queue
+import tarfile
+import threading
+import zipfile
+
+import metrics
+
+# Prefetch defaults: documents read ahead of the one being processed, and the most
+# bytes held by documents waiting in the queue
+DEFAULT_PREFETCH = 4
+DEFAULT_PREFETCH_MB = 256
+# Chunk size used when reading files on disk ahead of processing
+WARM_CHUNK = 1024 * 1024
+
+
+def is_pdf_name(name: str) -> bool:
+    return name.lower().endswith(".pdf")
+
+
+def is_safe_member(name: str) -> bool:
+    # Archive member names become output paths: no absolute paths or ".." components
+    return not name.startswith(("/", "\\")) and ".." not in name.replace("\\", "/").split("/")
+
+
+class PdfSource:
+    """
+    Where the PDFs of a run come from: a directory, a zip or tar archive, or a file list.
+
+    names() lists the documents (the names outputs are written under), path()
+    gives a document's file on disk, or None for archive members, and
+    documents() yields (name, path or bytes) pairs for extract_outline,
+    optionally read ahead by a background thread. Files on disk are always
+    passed on by path, so workers open them themselves instead of receiving
+    their bytes.
+    """
+
+    def names(self) -> list[str]:
+        raise NotImplementedError
+
+    def path(self, name: str) -> str | None:
+        return None
+
+    def read(self, name: str) -> bytes:
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def iter_bytes(self, names: list[str]):
+        # (name, bytes) in the order reads are cheapest; a document that cannot be read
+        # is yielded with the exception instead of its bytes
+        for name in names:
+            try:
+                yield name, self.read(name)
+            except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                yield name, e
+
+    def iter_warmed(self, names: list[str]):
+        # (name, path) for files on disk, each read once first so it is in the page cache
+        # when it is opened; a file that cannot be read is yielded with the exception
+        for name in names:
+            path = self.path(name)
+            try:
+                with open(path, "rb") as f:
+                    while chunk := f.read(WARM_CHUNK):
+                        metrics.increment("bytes_read", len(chunk))
+            except OSError as e:
+                yield name, e
+                continue
+            yield name, path
+
+    def documents(self, names: list[str], prefetch: int = DEFAULT_PREFETCH,
+                  prefetch_mb: float = DEFAULT_PREFETCH_MB):
+        on_disk = all(self.path(name) is not None for name in names)
+        if prefetch > 0:
+            items = self.iter_warmed(names) if on_disk else self.iter_bytes(names)
+            return prefetched(items, prefetch, int(prefetch_mb * 1024 * 1024))
+        if on_disk:
+            # No prefetching: files on disk are opened by path where they are processed
+            return ((name, self.path(name)) for name in names)
+        return self.iter_bytes(names)
+
+    def close(self):
+        pass
+
+
+class DirectorySource(PdfSource):
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def names(self) -> list[str]:
+        return sorted(f for f in os.listdir(self.directory) if is_pdf_name(f))
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+
+class FileListSource(PdfSource):
+    # Text file with one PDF path per line; blank lines and lines starting with # are
+    # skipped. Outputs are named after the file names, which must be unique.
+    def __init__(self, list_path: str):
+        self.paths = {}
+        with open(list_path, "r", encoding="utf-8") as f:
+            for line in f:
+                pdf_path = line.strip()
+                if not pdf_path or pdf_path.startswith("#"):
+                    continue
+                name = os.path.basename(pdf_path)
+                if name in self.paths and self.paths[name] != pdf_path:
+                    raise ValueError(f"{list_path}: {self.paths[name]} and {pdf_path} have the same file name")
+                self.paths[name] = pdf_path
+
+    def names(self) -> list[str]:
+        return sorted(self.paths)
+
+    def path(self, name: str) -> str:
+        return self.paths[name]
+
+
+class ZipSource(PdfSource):
+    # Members keep their path inside the archive as their name, so outputs mirror its layout
+    def __init__(self, archive_path: str):
+        self._zip = zipfile.ZipFile(archive_path)
+
+    def names(self) -> list[str]:
+        return sorted(
+            info.filename for info in self._zip.infolist()
+            if not info.is_dir() and is_pdf_name(info.filename) and is_safe_member(info.filename)
+        )
+
+    def read(self, name: str) -> bytes:
+        return self._zip.read(name)
+
+    def close(self):
+        self._zip.close()
+
+
+class TarSource(PdfSource):
+    # Plain or compressed tar. Compressed tars cannot be read out of order cheaply, so
+    # iter_bytes makes a single pass over the archive and yields members in archive order.
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+
+    def names(self) -> list[str]:
+        with tarfile.open(self.archive_path, "r|*") as tar:
+            return [
+                member.name for member in tar
+                if member.isfile() and is_pdf_name(member.name) and is_safe_member(member.name)
+            ]
+
+    def read(self, name: str) -> bytes:
+        with tarfile.open(self.archive_path, "r:*") as tar:
+            return tar.extractfile(name).read()
+
+    def iter_bytes(self, names: list[str]):
+        wanted = set(names)
+        try:
+            with tarfile.open(self.archive_path, "r|*") as tar:
+                for member in tar:
+                    if member.name in wanted:
+                        wanted.discard(member.name)
+                        yield member.name, tar.extractfile(member).read()
+        except (OSError, tarfile.TarError) as e:
+            # A damaged archive fails the members not read yet
+            for name in sorted(wanted):
+                yield name, e
+
+
+def open_source(input_path: str) -> PdfSource:
+    """Return the source for a directory, a zip or tar archive, or a text file listing PDF paths."""
+    if os.path.isdir(input_path):
+        return DirectorySource(input_path)
+    if zipfile.is_zipfile(input_path):
+        return ZipSource(input_path)
+    if tarfile.is_tarfile(input_path):
+        return TarSource(input_path)
+    return FileListSource(input_path)
+
+
+def prefetched(items, max_items: int = DEFAULT_PREFETCH, max_bytes: int = DEFAULT_PREFETCH_MB * 1024 * 1024):
+    """
+    Iterate over (name, bytes or path) items read ahead by a background thread.
+
+    At most max_items documents, and max_bytes bytes of documents held in
+    memory (always at least one document), wait in the queue, so reading the next documents overlaps with
+    processing the current one. Time spent reading is recorded as the "read"
+    stage and time spent waiting for a document as "read_wait".
+    """
+    ready = queue.Queue(max_items)
+    space = threading.Condition()
+    queued_bytes = 0
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        nonlocal queued_bytes
+        try:
+            iterator = iter(items)
+            while not stop.is_set():
+                with metrics.timer("read"):
+                    item = next(iterator, done)
+                if item is done:
+                    break
+                size = len(item[1]) if isinstance(item[1], bytes) else 0
+                with space:
+                    space.wait_for(lambda: queued_bytes == 0 or queued_bytes + size <= max_bytes or stop.is_set())
+                    queued_bytes += size
+                ready.put((item, size))
+        except BaseException as e:
+            ready.put((e, 0))
+            return
+        ready.put((done, 0))
+
+    thread = threading.Thread(target=produce, name="pdf-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            with metrics.timer("read_wait"):
+                item, size = ready.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            with space:
+                queued_bytes -= size
+                space.notify()
+            metrics.increment("bytes_read", size)
+            yield item
+    finally:
+        # Stop the reader if iteration ends early and unblock it if it is waiting
+        stop.set()
+        with space:
+            space.notify()
+        while thread.is_alive():
+            try:
+                ready.get(timeout=0.05)
+            except queue.Empty:
+                pass
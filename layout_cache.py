@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import fitz # PyMuPDF
+import numpy as np
+
+import metrics
+from line_table import LineTable
+from pdf_processor import EXTRACTOR_VERSION, extract_text_with_layout
+
+DEFAULT_CACHE_DIR = os.environ.get("LAYOUT_CACHE_DIR", ".layout_cache")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3 # 2 GiB
+# Other processes sharing the cache directory add entries this process does not count, so the
+# directory is measured again once this process has added this share of max_bytes
+RESCAN_SHARE = 1 / 16
+
+# Numeric LineTable columns, each stored as its own .npy file so it can be memory-mapped
+ARRAY_COLUMNS = ("font_size", "is_bold", "bbox", "page", "font_code", "page_widths", "page_heights")
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_sha256(pdf_path) -> str:
+    # Hash of a PDF given as a path or as its bytes; both give the same digest
+    if isinstance(pdf_path, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(pdf_path).hexdigest()
+    return file_sha256(pdf_path)
+
+
+def cache_key(pdf_path, lean: bool = False) -> str:
+    # The PDF content plus everything that can change what extraction produces
+    content_hash = content_sha256(pdf_path)
+    versions = f"pymupdf={fitz.VersionBind};extractor={EXTRACTOR_VERSION}"
+    if lean:
+        versions += ";lean"
+    return hashlib.sha256(f"{content_hash}:{versions}".encode()).hexdigest()
+
+
+class LayoutCache:
+    """
+    Persistent cache of extract_text_with_layout results.
+
+    Entries are keyed by the PDF content hash, the PyMuPDF version,
+    EXTRACTOR_VERSION and the extraction mode (default or lean). Each entry is a directory of .npy columns (loaded
+    memory-mapped) plus the line texts as one UTF-8 blob with offsets. When the
+    cache grows past max_bytes the least recently used entries are removed.
+    The cache size is kept as a running total, so the directory is only walked
+    on first use, when the total goes over max_bytes, and after every
+    RESCAN_SHARE of max_bytes added.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        # Bytes in the cache as of the last walk plus what this process added since (None: not walked yet)
+        self._total_bytes = None
+        self._added_bytes = 0
+
+    def extract(self, pdf_path: str | bytes, lean: bool = False, page_pool=None) -> LineTable:
+        """Return the layout of pdf_path from the cache, extracting and storing it on a miss."""
+        with metrics.timer("cache_lookup"):
+            key = cache_key(pdf_path, lean)
+            table = self.get(key)
+        if table is None:
+            metrics.increment("layout_cache_misses")
+            table = extract_text_with_layout(pdf_path, lean, page_pool)
+            with metrics.timer("cache_write"):
+                self.put(key, table)
+        else:
+            metrics.increment("layout_cache_hits")
+        return table
+
+    def get(self, key: str) -> LineTable | None:
+        entry_dir = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(entry_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            columns = {
+                name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode="r")
+                for name in ARRAY_COLUMNS
+            }
+            text_blob = np.load(os.path.join(entry_dir, "text.npy"), mmap_mode="r")
+            text_offsets = np.load(os.path.join(entry_dir, "text_offsets.npy")).tolist()
+        except (OSError, ValueError):
+            # Missing, partially evicted or corrupt entry: treat as a miss
+            return None
+
+        blob = text_blob.tobytes() if len(text_blob) else b""
+        text = [blob[start:end].decode("utf-8") for start, end in zip(text_offsets[:-1], text_offsets[1:])]
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        return LineTable(text=text, font_names=meta["font_names"], first_page=meta["first_page"], **columns)
+
+    def put(self, key: str, table: LineTable):
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry_dir):
+            return
+
+        encoded = [t.encode("utf-8") for t in table.text]
+        text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in encoded], out=text_offsets[1:])
+
+        # Write into a temporary directory and rename it into place, so readers
+        # (possibly in other processes) never see a partial entry
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.cache_dir)
+        try:
+            for name in ARRAY_COLUMNS:
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(getattr(table, name)))
+            np.save(os.path.join(tmp_dir, "text.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            np.save(os.path.join(tmp_dir, "text_offsets.npy"), text_offsets)
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "font_names": table.font_names,
+                    "first_page": table.first_page,
+                    "pymupdf_version": fitz.VersionBind,
+                    "extractor_version": EXTRACTOR_VERSION,
+                    "created": time.time()
+                }, f)
+            size = _entry_size(tmp_dir)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry first, or the disk is full
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        if self._total_bytes is not None:
+            self._total_bytes += size
+            self._added_bytes += size
+        if (self._total_bytes is None or self._total_bytes > self.max_bytes
+                or self._added_bytes >= self.max_bytes * RESCAN_SHARE):
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total_bytes = 0
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = _entry_size(entry_dir)
+                last_used = os.stat(entry_dir).st_mtime
+            except OSError:
+                continue
+            entries.append((last_used, size, entry_dir))
+            total_bytes += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_bytes -= size
+        self._total_bytes = total_bytes
+        self._added_bytes = 0
+
+
+def _entry_size(entry_dir: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+
+
+def extract_with_cache(pdf_path: str | bytes, cache: LayoutCache | None = None, lean: bool = False,
+                       page_pool=None) -> LineTable:
+    # Convenience wrapper used by the entry points: no cache means plain extraction
+    if cache is None:
+        return extract_text_with_layout(pdf_path, lean, page_pool)
+    return cache.extract(pdf_path, lean, page_pool)
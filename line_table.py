@@ -0,0 +1,215 @@
+from array import array
+from collections.abc import Mapping
+import sys
+
+import numpy as np
+
+LINE_KEYS = ("text", "font_size", "font_name", "bbox", "page", "page_width", "page_height", "is_bold")
+
+
+class LineView(Mapping):
+    """Read-only dict-style view of one row of a LineTable."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        table, i = self._table, self._index
+        if key == "text":
+            return table.text[i]
+        if key == "font_size":
+            return float(table.font_size[i])
+        if key == "font_name":
+            return table.font_names[table.font_code[i]]
+        if key == "bbox":
+            return tuple(table.bbox[i].tolist())
+        if key == "page":
+            return int(table.page[i])
+        if key == "page_width":
+            return float(table.page_widths[table.page[i] - table.first_page])
+        if key == "page_height":
+            return float(table.page_heights[table.page[i] - table.first_page])
+        if key == "is_bold":
+            return bool(table.is_bold[i])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(LINE_KEYS)
+
+    def __len__(self):
+        return len(LINE_KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class LineTable:
+    """
+    Columnar storage for the text lines of a document.
+
+    Numeric attributes live in NumPy arrays (one entry per line), page sizes are
+    stored once per page and font names once per distinct font. Indexing or
+    iterating yields LineView objects, so code written against the old
+    list-of-dicts format keeps working.
+    """
+
+    def __init__(self, text, font_size, is_bold, bbox, page, font_code, font_names, page_widths, page_heights, first_page=0):
+        self.text = text                    # list[str], one per line (interned)
+        self.font_size = font_size          # float64 (n,)
+        self.is_bold = is_bold              # bool (n,)
+        self.bbox = bbox                    # float64 (n, 4): x0, y0, x1, y1
+        self.page = page                    # int32 (n,), 0-based page index
+        self.font_code = font_code          # int32 (n,), index into font_names
+        self.font_names = font_names        # list[str], distinct font names
+        self.page_widths = page_widths      # float64 (page_count,), indexed by page - first_page
+        self.page_heights = page_heights    # float64 (page_count,), indexed by page - first_page
+        self.first_page = first_page        # page number of page_widths[0]
+
+    def __len__(self):
+        return len(self.text)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # A list of views, like slicing the old list of line dicts
+            return [LineView(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line index out of range")
+        return LineView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield LineView(self, index)
+
+    @property
+    def page_width(self) -> np.ndarray:
+        # Per-line page width
+        return self.page_widths[self.page - self.first_page]
+
+    @property
+    def page_height(self) -> np.ndarray:
+        # Per-line page height
+        return self.page_heights[self.page - self.first_page]
+
+    @property
+    def page_count(self) -> int:
+        # Number of pages covered, including pages without lines
+        return len(self.page_widths)
+
+    def head_pages(self, page_count: int) -> "LineTable":
+        # The lines of the first page_count pages; lines are stored in page order
+        if page_count >= self.page_count:
+            return self
+        end = int(np.searchsorted(self.page, self.first_page + page_count))
+        return LineTable(
+            text=self.text[:end],
+            font_size=self.font_size[:end],
+            is_bold=self.is_bold[:end],
+            bbox=self.bbox[:end],
+            page=self.page[:end],
+            font_code=self.font_code[:end],
+            font_names=self.font_names,
+            page_widths=self.page_widths[:page_count],
+            page_heights=self.page_heights[:page_count],
+            first_page=self.first_page,
+        )
+
+    def to_dicts(self) -> list[dict]:
+        return [dict(line) for line in self]
+
+    @classmethod
+    def concat(cls, tables) -> "LineTable":
+        # Join tables covering consecutive page ranges (e.g. per-page tables from a stream)
+        builder = LineTableBuilder()
+        for table in tables:
+            for page_offset, (width, height) in enumerate(zip(table.page_widths.tolist(), table.page_heights.tolist())):
+                builder.set_page(table.first_page + page_offset, width, height)
+            builder.extend(table)
+        return builder.build()
+
+    @classmethod
+    def from_dicts(cls, lines) -> "LineTable":
+        builder = LineTableBuilder()
+        for line in lines:
+            builder.set_page(line["page"], line["page_width"], line["page_height"])
+            builder.add_line(line["text"], line["font_size"], line["font_name"], line["bbox"], line["is_bold"])
+        return builder.build()
+
+
+class LineTableBuilder:
+    """Accumulates lines page by page in compact buffers and builds a LineTable."""
+
+    def __init__(self):
+        self.text = []
+        self.font_size = array("d")
+        self.is_bold = array("b")
+        self.bbox = array("d")
+        self.page = array("i")
+        self.font_code = array("i")
+        self.font_names = []
+        self._font_codes = {}
+        self.page_widths = {}
+        self.page_heights = {}
+        self._current_page = 0
+
+    def __len__(self):
+        return len(self.text)
+
+    def set_page(self, page_num, page_width, page_height):
+        self._current_page = page_num
+        self.page_widths[page_num] = page_width
+        self.page_heights[page_num] = page_height
+
+    def add_line(self, text, font_size, font_name, bbox, is_bold):
+        font_code = self._font_codes.get(font_name)
+        if font_code is None:
+            font_code = self._font_codes[font_name] = len(self.font_names)
+            self.font_names.append(sys.intern(font_name))
+        # Repeated lines (headers, footers) share one string object
+        self.text.append(sys.intern(text))
+        self.font_size.append(font_size)
+        self.is_bold.append(1 if is_bold else 0)
+        self.bbox.extend(bbox)
+        self.page.append(self._current_page)
+        self.font_code.append(font_code)
+
+    def extend(self, table: LineTable):
+        # Append all lines of another table, remapping its font codes
+        font_codes = array("i")
+        for font_name in table.font_names:
+            font_code = self._font_codes.get(font_name)
+            if font_code is None:
+                font_code = self._font_codes[font_name] = len(self.font_names)
+                self.font_names.append(font_name)
+            font_codes.append(font_code)
+        self.text.extend(table.text)
+        self.font_size.extend(table.font_size.tolist())
+        self.is_bold.extend(table.is_bold.astype(np.int8).tolist())
+        self.bbox.extend(table.bbox.ravel().tolist())
+        self.page.extend(table.page.tolist())
+        self.font_code.extend(np.frombuffer(font_codes, dtype=np.int32)[table.font_code].tolist())
+
+    def build(self) -> LineTable:
+        first_page = min(self.page_widths) if self.page_widths else 0
+        page_count = max(self.page_widths) - first_page + 1 if self.page_widths else 0
+        page_widths = np.zeros(page_count, dtype=np.float64)
+        page_heights = np.zeros(page_count, dtype=np.float64)
+        for page_num, width in self.page_widths.items():
+            page_widths[page_num - first_page] = width
+            page_heights[page_num - first_page] = self.page_heights[page_num]
+        return LineTable(
+            text=self.text,
+            font_size=np.frombuffer(self.font_size, dtype=np.float64),
+            is_bold=np.frombuffer(self.is_bold, dtype=np.int8).astype(bool),
+            bbox=np.frombuffer(self.bbox, dtype=np.float64).reshape(-1, 4),
+            page=np.frombuffer(self.page, dtype=np.int32),
+            font_code=np.frombuffer(self.font_code, dtype=np.int32),
+            font_names=self.font_names,
+            page_widths=page_widths,
+            page_heights=page_heights,
+            first_page=first_page,
+        )
@@ -6,105 +6,841 @@ This script extracts structured outlines (title and headings) from PDF files.
 It uses a combination of heuristic rules and machine learning to identify headings.
 
 Usage:
-    python main.py input_dir output_dir
+    python main.py input_dir output_dir [--workers N] [--timeout SECONDS] [--stream] [--lean] [--no-toc] [--cache-dir DIR]
+                                        [--prefilter [--prefilter-size-ratio R]]
+                                        [--incremental] [--watch [--poll-interval SECONDS]]
+                                        [--metrics-json PATH] [--metrics-prom PATH]
+                                        [--output-format {json,jsonl} [--shard-size N]] [--pretty]
+                                        [--time-budget SECONDS] [--memory-budget-mb MB] [--max-pages N]
+                                        [--prefetch N] [--prefetch-mb MB]
+                                        [--page-parallel-threshold PAGES] [--page-workers N]
+                                        [--profile DIR [--profile-top N] [--profiler NAME]]
 
 Where:
-    input_dir: Directory containing PDF files to process
+    input_dir: Directory containing PDF files to process, a zip or tar archive, or a text file listing PDF paths
     output_dir: Directory where JSON output files will be saved
+    --workers: Number of worker processes (default 1, processes PDFs serially)
+    --timeout: Per-file time limit in seconds when running with workers
+    --stream: Extract and classify page by page to keep memory bounded on very long PDFs
+    --lean: Skip image data during extraction and take bold from font flags (faster on image-heavy PDFs)
+    --no-toc: Always run layout analysis, even for PDFs with a usable embedded table of contents
+    --prefilter: Only score lines that pass cheap layout rules with the model (see heading_extractor.Prefilter)
+    --cache-dir: Reuse extracted layouts stored in DIR (see layout_cache.py)
+    --incremental: Only process PDFs that are new or changed since the last run
+    --watch: Keep running and process PDFs as they land in input_dir (implies --incremental)
+    --metrics-json: Write a JSON run report with per-stage timings and per-file durations
+    --metrics-prom: Write the run's metrics in Prometheus text format
+    --output-format: json writes one file per PDF; jsonl appends all results to outlines-NNNNN.jsonl bundles
+    --pretty: Indent per-file JSON output (compact by default)
+    --time-budget, --memory-budget-mb, --max-pages: Per-document budgets; documents over budget degrade
+        gracefully (see budget.py) and each output records the degradation level used
+    --prefetch: Documents read ahead by a background thread, overlapping I/O with processing
+    --page-parallel-threshold: Documents with at least this many pages are extracted in page ranges
+        on several processes (see page_parallel.py); not used with --stream or budgets
+    --page-workers: Processes for page-parallel extraction when processing serially
+    --profile: Profile every document and write a hot-function summary, collapsed stacks and the
+        full profiles of the --profile-top slowest documents to DIR (see profiling.py)
 """
 
 import os
 import sys
-import json
 import time
-from pdf_processor import extract_text_with_layout
-from heading_extractor import extract_title, assign_levels
+import signal
+import argparse
+import itertools
+import multiprocessing
+from collections import deque
+import metrics
+from pdf_processor import EXTRACTOR_VERSION, extract_page_range, iter_pages_with_layout
+from heading_extractor import (Prefilter, extract_title, assign_levels, get_prefilter, iter_outline, load_model,
+                               model_version, set_prefilter)
+from layout_cache import LayoutCache, cache_key, extract_with_cache
+from embedded_toc import toc_outline
+from manifest import MANIFEST_NAME, Manifest
+from output_writer import DEFAULT_SHARD_SIZE, open_writer
+from budget import FULL, Budget, budgeted_outline
+from input_source import (DEFAULT_PREFETCH, DEFAULT_PREFETCH_MB, DirectorySource, PdfSource, TarSource, ZipSource,
+                          open_source)
+from page_parallel import (DEFAULT_PAGE_PARALLEL_THRESHOLD, RANGES_PER_WORKER, DeferringPagePool, PagePool,
+                           SplitDocument, merge_ranges, page_ranges, range_source)
+from profiling import DEFAULT_PROFILE_TOP, PROFILERS, DocumentProfiler, ProfileCollector
 
-def process_pdf(pdf_path: str) -> dict:
+# Extra time the parent waits past --timeout before giving up on a worker that
+# did not stop by itself (e.g. it crashed or is stuck inside native code)
+HARD_TIMEOUT_GRACE = 10.0
+
+EMPTY_RESULT = {"title": "", "outline": []}
+
+# In incremental mode the manifest is saved after this many processed files
+MANIFEST_SAVE_EVERY = 100
+
+@metrics.timer("document")
+def extract_outline(pdf_path: str | bytes, stream: bool = False, cache: LayoutCache | None = None, model=None,
+                    lean: bool = False, use_toc: bool = True, budget: Budget | None = None,
+                    page_pool: PagePool | None = None) -> dict:
     """
-    Process a single PDF file and extract title and outline.
+    Extract title and outline from a single PDF file.
     
     Args:
-        pdf_path: Path to the PDF file
+        pdf_path: Path to the PDF file, or its bytes
+        stream: Process the document page by page instead of loading all lines at once
+        cache: Layout cache to read extracted lines from (not used when streaming)
+        model: Model used to classify lines (defaults to heading_extractor.load_model())
+        lean: Use the lean extraction path (see pdf_processor.LEAN_TEXT_FLAGS)
+        use_toc: Take the outline from the PDF's bookmarks when they pass the checks in embedded_toc.py
+        budget: Time, memory and page limits; the whole document is then held in memory
+            (stream is ignored) and the result gets a "degradation" field
+        page_pool: Extracts documents with many pages in parallel page ranges (not used when
+            streaming or with a budget)
         
     Returns:
         Dictionary containing title and outline
+        
+    Raises:
+        Any exception raised while opening or parsing the PDF
     """
-    try:
+    toc_result = toc_outline(pdf_path, lean) if use_toc else None
+    degradation = FULL
+    if toc_result is not None:
+        # The document's own bookmarks replace layout analysis
+        title, outline = toc_result["title"], toc_result["outline"]
+    elif budget is not None:
+        # Extraction and classification degrade in stages when the document runs over budget
+        title, outline, degradation = budgeted_outline(pdf_path, budget, cache, model, lean)
+    elif stream:
+        # Pages are extracted, classified and dropped as they arrive; the title
+        # comes from the first page, which is always yielded first
+        page_tables = iter_pages_with_layout(pdf_path, lean)
+        first_page = next(page_tables, None)
+        title = extract_title(first_page) if first_page is not None else ""
+        outline = iter_outline(itertools.chain([first_page], page_tables), model=model) if first_page is not None else []
+    else:
         # Extract text with layout information
-        extracted_data = extract_text_with_layout(pdf_path)
+        extracted_data = extract_with_cache(pdf_path, cache, lean, page_pool)
         
         # Extract title
         title = extract_title(extracted_data)
         
         # Extract outline (headings)
-        outline = assign_levels(extracted_data)
-        
-        # Format outline for output
-        formatted_outline = []
-        for item in outline:
-            formatted_outline.append({
-                "level": item["level"],
-                "text": item["text"],
-                "page": item["page"]
-            })
+        outline = assign_levels(extracted_data, model=model)
+    
+    return format_result(title, outline, degradation if budget is not None else None)
+
+def format_result(title: str, outline, degradation: str | None = None) -> dict:
+    """Build the output dictionary from a title and outline entries, counting the document."""
+    formatted_outline = []
+    for item in outline:
+        formatted_outline.append({
+            "level": item["level"],
+            "text": item["text"],
+            "page": item["page"]
+        })
+    metrics.increment("documents")
+    metrics.increment("headings", len(formatted_outline))
+    
+    result = {
+        "title": title,
+        "outline": formatted_outline
+    }
+    if degradation is not None:
+        result["degradation"] = degradation
+    return result
+
+def process_pdf(pdf_path: str, stream: bool = False, cache: LayoutCache | None = None, lean: bool = False,
+                use_toc: bool = True, budget: Budget | None = None) -> dict:
+    """
+    Process a single PDF file and extract title and outline.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        stream: Process the document page by page instead of loading all lines at once
+        cache: Layout cache to read extracted lines from (not used when streaming)
+        lean: Use the lean extraction path
+        use_toc: Use the embedded table of contents when it is usable
+        budget: Per-document budget (see budget.Budget)
         
-        return {
-            "title": title,
-            "outline": formatted_outline
-        }
+    Returns:
+        Dictionary containing title and outline
+    """
+    try:
+        return extract_outline(pdf_path, stream, cache, lean=lean, use_toc=use_toc, budget=budget)
     
     except Exception as e:
         print(f"Error processing {pdf_path}: {str(e)}")
-        return {
-            "title": "",
-            "outline": []
-        }
+        return dict(EMPTY_RESULT)
+
+class DocumentTimeout(Exception):
+    """
+    Raised by the SIGALRM handler when a worker runs past its time limit.
+    
+    Not the builtin TimeoutError: that is an OSError, and the `except OSError`
+    handlers in the extraction code (e.g. the layout cache) would swallow it.
+    """
+
+def _raise_timeout(signum, frame):
+    raise DocumentTimeout("processing time limit exceeded")
+
+# Set in each worker by _init_worker; workers report the files they pick up on it
+_started_queue = None
+
+def _init_worker(started_queue, prefilter: Prefilter | None = None):
+    """Prepare a pool worker process."""
+    global _started_queue
+    _started_queue = started_queue
+    set_prefilter(prefilter)
+    # Load the model once per worker, and keep each worker single-threaded so
+    # N workers use N cores
+    model = load_model()
+    if model is not None:
+        model.set_threads(1)
+    # Let the parent handle Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, _raise_timeout)
+
+def _process_in_worker(pdf_file: str, pdf_path: str | bytes, timeout: float | None, stream: bool = False,
+                       cache: LayoutCache | None = None, lean: bool = False, use_toc: bool = True,
+                       budget: Budget | None = None, page_threshold: int | None = None,
+                       profiler: str | None = None) -> tuple[str, dict | str | int, float, dict, object]:
+    """
+    Run extract_outline in a worker.
+    
+    Returns ("ok", result), ("error" | "timeout", message) or ("split", page_count)
+    for a document of at least page_threshold pages that the parent extracts in
+    page ranges, followed by the time spent on the file, the metrics it recorded
+    and its profiling.DocumentProfile when profiler is set (None otherwise).
+    """
+    _started_queue.put(pdf_file)
+    # Each file's metrics are sent back to the parent, which aggregates them
+    metrics.METRICS.reset()
+    document_profiler = DocumentProfiler(profiler) if profiler else None
+    start = time.perf_counter()
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    if document_profiler is not None:
+        document_profiler.start()
+    try:
+        page_pool = DeferringPagePool(page_threshold) if page_threshold else None
+        status, payload = "ok", extract_outline(pdf_path, stream, cache, lean=lean, use_toc=use_toc, budget=budget,
+                                                page_pool=page_pool)
+    except SplitDocument as e:
+        status, payload = "split", e.page_count
+    except DocumentTimeout:
+        status, payload = "timeout", f"exceeded {timeout:g}s time limit"
+    except Exception as e:
+        status, payload = "error", f"{type(e).__name__}: {e}"
+    finally:
+        if document_profiler is not None:
+            document_profiler.stop()
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    seconds = time.perf_counter() - start
+    profile = document_profiler.profile(pdf_file, seconds, status) if document_profiler is not None else None
+    snapshot = metrics.METRICS.snapshot()
+    if status == "split":
+        # The parent records the "document" stage of a split document once, for all its parts
+        snapshot["stages"].pop("document", None)
+    return status, payload, seconds, snapshot, profile
+
+def _extract_range_in_worker(task_key: tuple[str, int], pdf_path: str | bytes, start: int, stop: int,
+                            timeout: float | None, lean: bool = False,
+                            profiler: str | None = None) -> tuple[str, object, float, dict, object]:
+    """
+    Extract pages start..stop-1 of a split document in a worker.
+    
+    Returns ("ok", line_table) or ("error" | "timeout", message), followed by
+    the time spent, the metrics recorded and the profile, like _process_in_worker.
+    """
+    _started_queue.put(task_key)
+    metrics.METRICS.reset()
+    document_profiler = DocumentProfiler(profiler) if profiler else None
+    started = time.perf_counter()
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    if document_profiler is not None:
+        document_profiler.start()
+    try:
+        status, payload = "ok", extract_page_range(pdf_path, start, stop, lean)
+    except DocumentTimeout:
+        status, payload = "timeout", f"exceeded {timeout:g}s time limit on pages {start + 1}-{stop}"
+    except Exception as e:
+        status, payload = "error", f"{type(e).__name__}: {e}"
+    finally:
+        if document_profiler is not None:
+            document_profiler.stop()
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    seconds = time.perf_counter() - started
+    profile = document_profiler.profile(task_key[0], seconds, status) if document_profiler is not None else None
+    return status, payload, seconds, metrics.METRICS.snapshot(), profile
+
+def _finish_split_document(pdf_path: str | bytes, tables: list, cache: LayoutCache | None,
+                           lean: bool) -> tuple[str, dict | str]:
+    """Merge the page ranges of a split document and classify it in the parent."""
+    try:
+        extracted_data = merge_ranges(tables)
+        if cache is not None:
+            with metrics.timer("cache_write"):
+                cache.put(cache_key(pdf_path, lean), extracted_data)
+        title = extract_title(extracted_data)
+        outline = assign_levels(extracted_data)
+        metrics.increment("page_parallel_documents")
+        return "ok", format_result(title, outline)
+    except Exception as e:
+        return "error", f"{type(e).__name__}: {e}"
+
+def process_pdfs_parallel(pdf_documents, workers: int, timeout: float | None = None, stream: bool = False,
+                          cache: LayoutCache | None = None, lean: bool = False, use_toc: bool = True,
+                          budget: Budget | None = None, page_threshold: int | None = None,
+                          profiles: ProfileCollector | None = None):
+    """
+    Process PDFs on a pool of worker processes.
+    
+    At most `workers` files are in flight at once, and pdf_documents is only
+    consumed as workers become free. A file that does not finish
+    within `timeout` seconds is reported as a failure; if its worker does not
+    stop by itself (or crashed) the pool is replaced and the remaining in-flight
+    files are resubmitted, so one bad PDF cannot stall or kill the batch.
+    
+    A document with at least page_threshold pages is handed back by its worker
+    and split into page ranges that go to the same workers ahead of further
+    documents; the ranges are merged in page order and classified here, so the
+    result is identical to extracting the document in one piece. Each range has
+    the per-file time limit, and the document fails if any of its ranges fails.
+    
+    Args:
+        pdf_documents: Iterable of (pdf_file, path or bytes) pairs, e.g. from input_source
+        workers: Number of worker processes
+        timeout: Per-file time limit in seconds, or None for no limit
+        stream: Process each document page by page
+        cache: Layout cache shared by all workers
+        lean: Use the lean extraction path
+        use_toc: Use embedded tables of contents when they are usable
+        budget: Per-document budget (see budget.Budget)
+        page_threshold: Page count from which documents are extracted in parallel page
+            ranges, or None to process every document in one worker
+        profiles: Collects a profile of every document (the profiles of a split
+            document's parts are merged)
+        
+    Yields:
+        (pdf_file, status, result_or_message, seconds) tuples in completion order,
+        where status is "ok", "error" or "timeout". Metrics recorded by the
+        workers are merged into metrics.METRICS.
+    """
+    context = multiprocessing.get_context("spawn")
+    documents = iter(pdf_documents)
+    # Tasks submitted before new documents: page ranges of split documents, and tasks to
+    # resubmit after the pool was replaced. Tasks are (key, function, args), where the key
+    # is the pdf_file of a document or (pdf_file, range index) of a page range.
+    pending = deque()
+    # key -> (async result, time the worker picked it up or None while queued, task)
+    in_flight = {}
+    # pdf_file -> state of a split document whose page ranges are being extracted
+    splits = {}
+    profiler = profiles.profiler if profiles is not None else None
+    
+    def new_pool():
+        started_queue = context.SimpleQueue()
+        return context.Pool(workers, initializer=_init_worker, initargs=(started_queue, get_prefilter())), started_queue
+    
+    def split(pdf_file, pdf_path, page_count, seconds, profile):
+        ranges = page_ranges(page_count, workers * RANGES_PER_WORKER)
+        # Ranges are sent the file's path; bytes go to a temporary file once instead of into every task
+        pdf_path, temporary = range_source(pdf_path)
+        splits[pdf_file] = {"pdf_path": pdf_path, "temporary": temporary, "tables": [None] * len(ranges),
+                            "remaining": len(ranges), "failure": None, "seconds": seconds,
+                            "started": time.perf_counter(), "profile": profile}
+        pending.extendleft(reversed([
+            ((pdf_file, index), _extract_range_in_worker,
+             ((pdf_file, index), pdf_path, start, stop, timeout, lean, profiler))
+            for index, (start, stop) in enumerate(ranges)
+        ]))
+    
+    def range_done(key, status, payload, profile=None):
+        # Returns the document's (status, result_or_message, seconds) once all its ranges are done
+        pdf_file, index = key
+        state = splits[pdf_file]
+        state["remaining"] -= 1
+        if status == "ok":
+            state["tables"][index] = payload
+        elif state["failure"] is None:
+            state["failure"] = (status, payload)
+        if profile is not None:
+            state["profile"].merge(profile)
+        if state["remaining"]:
+            return None
+        del splits[pdf_file]
+        if state["failure"] is not None:
+            status, payload = state["failure"]
+        else:
+            document_profiler = DocumentProfiler(profiler) if profiler else None
+            if document_profiler is not None:
+                document_profiler.start()
+            try:
+                status, payload = _finish_split_document(state["pdf_path"], state["tables"], cache, lean)
+            finally:
+                if document_profiler is not None:
+                    document_profiler.stop()
+            if document_profiler is not None:
+                state["profile"].merge(document_profiler.profile(pdf_file, 0.0, status))
+        if state["temporary"]:
+            os.unlink(state["pdf_path"])
+        seconds = state["seconds"] + time.perf_counter() - state["started"]
+        # The split document's only "document" stage: from its first worker to the merged result
+        metrics.record_stage("document", seconds)
+        if profiles is not None:
+            state["profile"].seconds = seconds
+            state["profile"].status = status
+            profiles.add(state["profile"])
+        return status, payload, seconds
+    
+    pool, started_queue = new_pool()
+    try:
+        while True:
+            while len(in_flight) < workers:
+                if pending:
+                    task = pending.popleft()
+                else:
+                    document = next(documents, None)
+                    if document is None:
+                        break
+                    pdf_file, pdf_path = document
+                    task = (pdf_file, _process_in_worker,
+                            (pdf_file, pdf_path, timeout, stream, cache, lean, use_toc, budget, page_threshold,
+                             profiler))
+                key, function, function_args = task
+                in_flight[key] = (pool.apply_async(function, function_args), None, task)
+            if not in_flight:
+                break
+            
+            # Wait briefly on the oldest task, then collect everything that finished
+            oldest_result, _, _ = next(iter(in_flight.values()))
+            oldest_result.wait(0.05)
+            now = time.monotonic()
+            while not started_queue.empty():
+                key = started_queue.get()
+                if key in in_flight:
+                    async_result, _, task = in_flight[key]
+                    in_flight[key] = (async_result, now, task)
+            
+            stuck = None
+            for key, (async_result, started, task) in list(in_flight.items()):
+                if async_result.ready():
+                    del in_flight[key]
+                    status, payload, seconds, worker_metrics, profile = async_result.get()
+                    metrics.METRICS.merge(worker_metrics)
+                    if isinstance(key, tuple):
+                        finished = range_done(key, status, payload, profile)
+                        if finished is not None:
+                            yield (key[0], *finished)
+                    elif status == "split":
+                        split(key, task[2][1], payload, seconds, profile)
+                    else:
+                        if profile is not None:
+                            profiles.add(profile)
+                        yield key, status, payload, seconds
+                elif timeout and started is not None and now - started > timeout + HARD_TIMEOUT_GRACE:
+                    stuck = (key, now - started)
+                    break
+            
+            if stuck is not None:
+                stuck_key, seconds = stuck
+                del in_flight[stuck_key]
+                message = f"worker crashed or unresponsive after {timeout:g}s time limit"
+                if isinstance(stuck_key, tuple):
+                    finished = range_done(stuck_key, "timeout", message)
+                    if finished is not None:
+                        yield (stuck_key[0], *finished)
+                else:
+                    yield stuck_key, "timeout", message, seconds
+                # The stuck worker cannot be stopped on its own: replace the whole pool
+                # and resubmit the other tasks that were in flight
+                pool.terminate()
+                pool.join()
+                pending.extendleft(reversed([entry[2] for entry in in_flight.values()]))
+                in_flight.clear()
+                pool, started_queue = new_pool()
+    finally:
+        pool.terminate()
+        pool.join()
+        # Temporary files of split documents left by an interrupted run
+        for state in splits.values():
+            if state["temporary"]:
+                os.unlink(state["pdf_path"])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract titles and outlines from PDF files.")
+    parser.add_argument("input_dir", help="Directory containing PDF files to process, a zip or tar archive of PDFs, "
+                                          "or a text file listing PDF paths (one per line)")
+    parser.add_argument("output_dir", help="Directory where JSON output files will be saved")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default: 1, process serially)")
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="Per-file time limit in seconds when using --workers (0 disables, default: 120)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Extract and classify page by page to keep memory bounded on very long PDFs")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory of the on-disk layout cache; reuses extraction results across runs "
+                             "(ignored with --stream)")
+    parser.add_argument("--lean", action="store_true",
+                        help="Do not build image blocks during extraction and read bold from the font flags; "
+                             "much faster on image-heavy PDFs")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="Reject clear body text with cheap layout rules and only score the remaining lines "
+                             "with the model (audit the accuracy cost with evaluate_model.py --audit-prefilter)")
+    parser.add_argument("--prefilter-size-ratio", type=float, default=Prefilter().min_size_ratio,
+                        help="Font size relative to the page median from which non-bold, unnumbered lines are "
+                             "scored (default: %(default)s)")
+    parser.add_argument("--no-toc", dest="use_toc", action="store_false",
+                        help="Always run layout analysis instead of using a PDF's embedded table of contents")
+    parser.add_argument("--cache-max-mb", type=int, default=2048,
+                        help="Size limit of the layout cache in MB (default: 2048)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip PDFs whose output is current according to the manifest in output_dir")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep polling input_dir and process new or changed PDFs (implies --incremental)")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="Seconds between polls in --watch mode (default: 2)")
+    parser.add_argument("--metrics-json", default=None,
+                        help="Write a JSON run report (stage timings, counters, per-file durations) to this path")
+    parser.add_argument("--metrics-prom", default=None,
+                        help="Write the run's metrics in Prometheus text format to this path "
+                             "(e.g. for node_exporter's textfile collector)")
+    parser.add_argument("--output-format", choices=["json", "jsonl"], default="json",
+                        help="json: one file per PDF, written atomically by a background thread; "
+                             "jsonl: append results to outlines-NNNNN.jsonl bundles, one line per PDF (default: json)")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help="Results per bundle with --output-format jsonl (default: %(default)s)")
+    parser.add_argument("--pretty", action="store_true",
+                        help="Indent per-file JSON output instead of writing it compactly")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Per-document time budget in seconds; documents over budget degrade to fewer pages, "
+                             "heuristic levels and finally a title-only result (e.g. 10)")
+    parser.add_argument("--memory-budget-mb", type=float, default=None,
+                        help="Per-document budget for the growth of resident memory in MB, degrading as above")
+    parser.add_argument("--max-pages", type=int, default=None,
+                        help="Analyze at most this many leading pages of each document (e.g. 50)")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH,
+                        help="Documents read ahead by a background thread while others are processed "
+                             "(0 opens files by path where they are processed; default: %(default)s)")
+    parser.add_argument("--prefetch-mb", type=float, default=DEFAULT_PREFETCH_MB,
+                        help="Most MB of read-ahead documents held in memory (default: %(default)s)")
+    parser.add_argument("--page-parallel-threshold", type=int, default=DEFAULT_PAGE_PARALLEL_THRESHOLD,
+                        help="Extract documents with at least this many pages in parallel page ranges; with "
+                             "--workers the ranges run on the worker processes (0 disables; default: %(default)s)")
+    parser.add_argument("--page-workers", type=int, default=None,
+                        help="Processes for page-parallel extraction without --workers (default: all cores)")
+    parser.add_argument("--profile", default=None, metavar="DIR",
+                        help="Profile every document and write a hot-function summary by code area, collapsed "
+                             "stacks for flame graphs and the full profiles of the slowest documents to DIR")
+    parser.add_argument("--profile-top", type=int, default=DEFAULT_PROFILE_TOP,
+                        help="Slowest documents whose full profiles are kept (default: %(default)s)")
+    parser.add_argument("--profiler", choices=PROFILERS, default="auto",
+                        help="cprofile, or the pyinstrument sampling profiler; auto uses pyinstrument when it is "
+                             "installed (default: auto)")
+    args = parser.parse_args(argv)
+    args.budget = None
+    if args.time_budget or args.memory_budget_mb or args.max_pages:
+        args.budget = Budget(args.time_budget, args.memory_budget_mb, args.max_pages)
+    return args
+
+def process_files(pdf_files: list[str], source: PdfSource, writer, args, cache: LayoutCache | None = None,
+                  on_success=None, documents: list[dict] | None = None,
+                  profiles: ProfileCollector | None = None) -> list[tuple[str, str, str]]:
+    """
+    Process PDF files and hand each result to the output writer.
+    
+    Args:
+        pdf_files: Names of the documents in source
+        source: Directory, archive or file list the PDFs are read from (see input_source.py)
+        writer: Output writer from output_writer.open_writer
+        args: Parsed command line options (workers, timeout, stream, lean, use_toc, budget, prefetch,
+            page_parallel_threshold, page_workers)
+        cache: Layout cache to read extracted lines from
+        on_success: Called with (pdf_path, pdf_file, output_file) after each successful file,
+            where pdf_path is the file on disk or None for archive members
+        documents: If given, a {"file", "status", "seconds"} record is appended for each file
+        profiles: If given, every document is profiled and its profile added
+        
+    Returns:
+        List of (pdf_file, status, message) tuples for the files that failed
+    """
+    failures = []
+    
+    def record(pdf_file, status, message, seconds):
+        if status != "ok":
+            failures.append((pdf_file, status, message))
+            metrics.increment("documents_timed_out" if status == "timeout" else "documents_failed")
+        if documents is not None:
+            documents.append({"file": pdf_file, "status": status, "seconds": round(seconds, 4)})
+    
+    def save(pdf_file, result, ok):
+        output_file = writer.write(pdf_file, result)
+        print(f"Saved output to {output_file}")
+        if ok and on_success is not None:
+            on_success(source.path(pdf_file), pdf_file, output_file)
+    
+    def readable(pdf_documents):
+        # Files that could not be read fail here; the rest go on to extraction
+        for pdf_file, pdf_path in pdf_documents:
+            if isinstance(pdf_path, Exception):
+                print(f"Error reading {pdf_file}: {pdf_path}")
+                record(pdf_file, "error", f"{type(pdf_path).__name__}: {pdf_path}", 0.0)
+                save(pdf_file, dict(EMPTY_RESULT), False)
+                continue
+            yield pdf_file, pdf_path
+    
+    # With --prefetch, a background thread reads the next files while the current ones are processed
+    pdf_documents = source.documents(pdf_files, args.prefetch, args.prefetch_mb)
+    page_pool = None
+    try:
+        if args.workers > 1:
+            print(f"Using {args.workers} worker processes")
+            for pdf_file, status, payload, seconds in process_pdfs_parallel(readable(pdf_documents), args.workers,
+                                                                            args.timeout or None, args.stream, cache,
+                                                                            args.lean, args.use_toc, args.budget,
+                                                                            args.page_parallel_threshold or None,
+                                                                            profiles):
+                record(pdf_file, status, payload, seconds)
+                if status == "ok":
+                    save(pdf_file, payload, True)
+                else:
+                    print(f"Error processing {pdf_file}: {payload}")
+                    save(pdf_file, dict(EMPTY_RESULT), False)
+        else:
+            # Its processes are started on the first document that is long enough
+            if args.page_parallel_threshold:
+                page_pool = PagePool(args.page_workers, args.page_parallel_threshold)
+            for pdf_file, pdf_path in readable(pdf_documents):
+                print(f"Processing {pdf_file}...")
+                
+                # Process the PDF
+                document_profiler = DocumentProfiler(profiles.profiler) if profiles is not None else None
+                start = time.perf_counter()
+                if document_profiler is not None:
+                    document_profiler.start()
+                error = None
+                try:
+                    result = extract_outline(pdf_path, args.stream, cache, lean=args.lean, use_toc=args.use_toc,
+                                             budget=args.budget, page_pool=page_pool)
+                except Exception as e:
+                    error = e
+                finally:
+                    if document_profiler is not None:
+                        document_profiler.stop()
+                seconds = time.perf_counter() - start
+                if document_profiler is not None:
+                    profiles.add(document_profiler.profile(pdf_file, seconds, "ok" if error is None else "error"))
+                if error is not None:
+                    print(f"Error processing {pdf_file}: {str(error)}")
+                    record(pdf_file, "error", f"{type(error).__name__}: {error}", seconds)
+                    save(pdf_file, dict(EMPTY_RESULT), False)
+                    continue
+                record(pdf_file, "ok", None, seconds)
+                
+                # Save the result
+                save(pdf_file, result, True)
+    finally:
+        # Stops the prefetch thread if processing ended early
+        if hasattr(pdf_documents, "close"):
+            pdf_documents.close()
+        if page_pool is not None:
+            page_pool.close()
+    
+    if failures:
+        print(f"\n{len(failures)} of {len(pdf_files)} PDF files failed:")
+        for pdf_file, status, message in sorted(failures):
+            print(f"  {pdf_file} [{status}]: {message}")
+    
+    return failures
+
+def pipeline_version(lean: bool = False, use_toc: bool = True, prefilter: Prefilter | None = None,
+                     output_format: str = "json", budget: Budget | None = None) -> str:
+    """Identify the model, extractor and output format that produce outputs, for incremental runs."""
+    version = f"{model_version()};extractor={EXTRACTOR_VERSION}"
+    if lean:
+        version += ";lean"
+    if use_toc:
+        version += ";toc"
+    if prefilter is not None:
+        version += f";{prefilter!r}"
+    if output_format != "json":
+        version += f";{output_format}"
+    if budget is not None:
+        version += f";{budget!r}"
+    return version
+
+def process_changed_files(pdf_files: list[str], source: PdfSource, output_dir: str, writer, args, manifest: Manifest,
+                          cache: LayoutCache | None = None, report_skipped: bool = True,
+                          documents: list[dict] | None = None, profiles: ProfileCollector | None = None) -> int:
+    """
+    Process only the PDFs that are new or changed since the manifest was written.
+    
+    Returns:
+        Number of files processed
+    """
+    changed = [
+        pdf_file for pdf_file in pdf_files
+        if manifest.needs_processing(source.path(pdf_file), pdf_file, output_dir)
+    ]
+    skipped = len(pdf_files) - len(changed)
+    if skipped and report_skipped:
+        print(f"Skipping {skipped} unchanged PDF files")
+    if changed:
+        print(f"Processing {len(changed)} new or changed PDF files...")
+        processed = 0
+        
+        def on_success(pdf_path, pdf_file, output_file):
+            nonlocal processed
+            manifest.record(pdf_path, pdf_file, output_file)
+            processed += 1
+            # Save regularly so an interrupted run does not redo finished files; the
+            # outputs are flushed first so the manifest never lists results still in memory
+            if processed % MANIFEST_SAVE_EVERY == 0:
+                writer.flush()
+                manifest.save()
+        
+        process_files(changed, source, writer, args, cache, on_success, documents, profiles)
+    writer.flush()
+    manifest.save()
+    return len(changed)
+
+def write_metrics(args, documents: list[dict], wall_seconds: float):
+    """Write the run report and Prometheus metrics requested on the command line."""
+    if args.metrics_json:
+        report = metrics.run_report(documents, wall_seconds, {
+            "pipeline_version": pipeline_version(args.lean, args.use_toc, get_prefilter(), args.output_format,
+                                                 args.budget),
+            "options": {"workers": args.workers, "stream": args.stream, "lean": args.lean, "toc": args.use_toc,
+                        "prefilter": args.prefilter, "cache": bool(args.cache_dir),
+                        "incremental": args.incremental or args.watch,
+                        "output_format": args.output_format, "budget": repr(args.budget) if args.budget else None,
+                        "page_parallel_threshold": args.page_parallel_threshold,
+                        "profile": bool(args.profile)},
+        })
+        metrics.write_report(args.metrics_json, report)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+
+def watch(source: DirectorySource, output_dir: str, writer, args, manifest: Manifest,
+          cache: LayoutCache | None = None, profiles: ProfileCollector | None = None):
+    """
+    Poll the input directory and process PDFs as they land, until interrupted.
+    
+    A file is picked up once its size and mtime are unchanged between two polls,
+    so partially copied files are not processed. Metrics files and profiles are
+    rewritten after every poll that processed files.
+    """
+    print(f"Watching {source.directory} every {args.poll_interval:g} seconds (Ctrl+C to stop)")
+    previous_stats = {}
+    # Stats of files already handed to process_changed_files; they are only looked at again once they change
+    handled_stats = {}
+    documents = []
+    start_time = time.time()
+    try:
+        while True:
+            current_stats = {}
+            for pdf_file in source.names():
+                try:
+                    stat = os.stat(source.path(pdf_file))
+                except FileNotFoundError:
+                    continue
+                current_stats[pdf_file] = (stat.st_size, stat.st_mtime_ns)
+            stable = [
+                f for f, stat in current_stats.items()
+                if previous_stats.get(f) == stat and handled_stats.get(f) != stat
+            ]
+            previous_stats = current_stats
+            if stable:
+                process_changed_files(stable, source, output_dir, writer, args, manifest, cache,
+                                      report_skipped=False, documents=documents, profiles=profiles)
+                handled_stats.update((f, current_stats[f]) for f in stable)
+                write_metrics(args, documents, time.time() - start_time)
+                if profiles is not None:
+                    profiles.write()
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        writer.flush()
+        manifest.save()
 
 def main():
     """Main function to process all PDFs in input directory."""
-    if len(sys.argv) != 3:
-        print("Usage: python main.py input_dir output_dir")
-        sys.exit(1)
+    args = parse_args()
+    
+    output_dir = args.output_dir
     
-    input_dir = sys.argv[1]
-    output_dir = sys.argv[2]
+    # The input is a directory, a zip or tar archive, or a text file listing PDF paths
+    source = open_source(args.input_dir)
+    if args.watch and not isinstance(source, DirectorySource):
+        sys.exit("error: --watch needs an input directory")
+    if args.incremental and isinstance(source, (ZipSource, TarSource)):
+        sys.exit("error: --incremental needs an input directory or file list")
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    # Find all PDF files in input directory
-    pdf_files = [f for f in os.listdir(input_dir) if f.lower().endswith('.pdf')]
+    cache = LayoutCache(args.cache_dir, args.cache_max_mb * 1024 * 1024) if args.cache_dir else None
+    if args.prefilter:
+        set_prefilter(Prefilter(min_size_ratio=args.prefilter_size_ratio))
+    profiles = None
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+        profiles = ProfileCollector(args.profile, args.profile_top, args.profiler)
+    
+    if args.incremental or args.watch:
+        manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME),
+                            pipeline_version(args.lean, args.use_toc, get_prefilter(), args.output_format, args.budget))
+        if args.watch:
+            writer = open_writer(output_dir, args.output_format, args.pretty, args.shard_size)
+            try:
+                watch(source, output_dir, writer, args, manifest, cache, profiles)
+            finally:
+                writer.close()
+            return
+    
+    # Find all PDF files in the input
+    pdf_files = source.names()
     
     if not pdf_files:
-        print(f"No PDF files found in {input_dir}")
+        print(f"No PDF files found in {args.input_dir}")
         return
     
-    print(f"Processing {len(pdf_files)} PDF files...")
-    
     start_time = time.time()
+    documents = []
     
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(input_dir, pdf_file)
-        output_file = pdf_file.replace('.pdf', '.json')
-        output_path = os.path.join(output_dir, output_file)
-        
-        print(f"Processing {pdf_file}...")
-        
-        # Process the PDF
-        result = process_pdf(pdf_path)
-        
-        # Save the result
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        
-        print(f"Saved output to {output_file}")
+    writer = open_writer(output_dir, args.output_format, args.pretty, args.shard_size)
+    try:
+        if args.incremental:
+            processed = process_changed_files(pdf_files, source, output_dir, writer, args, manifest, cache,
+                                              documents=documents, profiles=profiles)
+        else:
+            print(f"Processing {len(pdf_files)} PDF files...")
+            process_files(pdf_files, source, writer, args, cache, documents=documents, profiles=profiles)
+            processed = len(pdf_files)
+    finally:
+        writer.close()
+        source.close()
     
     end_time = time.time()
     total_time = end_time - start_time
+    write_metrics(args, documents, total_time)
+    if profiles is not None and profiles.documents:
+        profiles.write()
+        areas = profiles.areas()
+        total = sum(areas.values()) or 1.0
+        print(f"\nProfile written to {args.profile} ({profiles.profiler}); self time by code area: "
+              + ", ".join(f"{area} {seconds / total:.0%}" for area, seconds in list(areas.items())[:6]))
     
     print(f"\nProcessing completed in {total_time:.2f} seconds")
-    print(f"Average time per PDF: {total_time/len(pdf_files):.2f} seconds")
+    if processed:
+        print(f"Average time per PDF: {total_time/processed:.2f} seconds")
+        if args.use_toc:
+            toc_documents = metrics.METRICS.counters.get("toc_fast_path", 0)
+            print(f"Embedded table of contents used for {toc_documents} of {processed} PDFs")
 
 if __name__ == "__main__":
     main()
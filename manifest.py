@@ -0,0 +1,75 @@
+import json
+import os
+
+from layout_cache import file_sha256
+from metrics import write_atomic
+
+MANIFEST_NAME = ".outline_manifest.json"
+
+
+class Manifest:
+    """
+    Record of which PDFs already have a current output, for incremental runs.
+
+    Each entry stores the PDF's size, mtime and SHA-256, the pipeline version
+    (model plus extractor) that produced the output, and the output file name.
+    A PDF whose size and mtime are unchanged is not re-hashed, so checking a
+    large, mostly unchanged directory only costs one stat per file.
+    """
+
+    def __init__(self, path: str, pipeline_version: str):
+        self.path = path
+        self.pipeline_version = pipeline_version
+        self.entries = {}
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f).get("files", {})
+            except (OSError, ValueError):
+                # Unreadable manifest: start over and reprocess everything
+                self.entries = {}
+
+    def needs_processing(self, pdf_path: str, pdf_file: str, output_dir: str) -> bool:
+        try:
+            stat = os.stat(pdf_path)
+        except FileNotFoundError:
+            # Deleted since it was listed, or a stale line of a file list: skip it
+            self.forget(pdf_file)
+            return False
+        entry = self.entries.get(pdf_file)
+        if entry is None or entry["pipeline_version"] != self.pipeline_version:
+            return True
+        if not os.path.exists(os.path.join(output_dir, entry["output"])):
+            return True
+        if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+            return False
+        # Touched or copied but possibly identical: compare content
+        if stat.st_size != entry["size"] or file_sha256(pdf_path) != entry["sha256"]:
+            return True
+        entry["mtime_ns"] = stat.st_mtime_ns
+        self.dirty = True
+        return False
+
+    def record(self, pdf_path: str, pdf_file: str, output_file: str):
+        stat = os.stat(pdf_path)
+        self.entries[pdf_file] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_sha256(pdf_path),
+            "pipeline_version": self.pipeline_version,
+            "output": output_file,
+        }
+        self.dirty = True
+
+    def forget(self, pdf_file: str):
+        if self.entries.pop(pdf_file, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        # Written to a temporary file and renamed, so an interrupted run never leaves a truncated manifest
+        write_atomic(self.path, json.dumps({"pipeline_version": self.pipeline_version, "files": self.entries}),
+                     prefix=".manifest-")
+        self.dirty = False
@@ -0,0 +1,179 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Prefix of every metric name in the Prometheus export
+METRIC_PREFIX = "pdf_outline"
+
+# Permissions of a file created with open() under the process umask
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+
+class Metrics:
+    """
+    Counters, stage timers and value summaries for the extraction pipeline.
+
+    Stage timers (document open, get_text, feature construction, inference, ...)
+    and values (lines per page) keep a count, sum and maximum, so recording is a
+    few dictionary updates and the memory used does not grow with the number of
+    documents. Worker processes send snapshot() back to the parent, which
+    merge()s them into its own collector.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.stages = {}
+        self.values = {}
+
+    @staticmethod
+    def _add(summaries: dict, name: str, count: int, total: float, maximum: float):
+        summary = summaries.get(name)
+        if summary is None:
+            summaries[name] = [count, total, maximum]
+        else:
+            summary[0] += count
+            summary[1] += total
+            if maximum > summary[2]:
+                summary[2] = maximum
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self._add(self.values, name, 1, value, value)
+
+    def record_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self._add(self.stages, stage, 1, seconds, seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            def summaries(source):
+                return {
+                    name: {"count": count, "sum": round(total, 6), "max": round(maximum, 6)}
+                    for name, (count, total, maximum) in sorted(source.items())
+                }
+            return {
+                "counters": dict(sorted(self.counters.items())),
+                "stages": summaries(self.stages),
+                "values": summaries(self.values),
+            }
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for target, kind in ((self.stages, "stages"), (self.values, "values")):
+                for name, summary in snapshot[kind].items():
+                    self._add(target, name, summary["count"], summary["sum"], summary["max"])
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.stages.clear()
+            self.values.clear()
+
+    def to_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        out = []
+        for name, value in snapshot["counters"].items():
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            out.append(f"# TYPE {metric} counter")
+            out.append(f"{metric} {value}")
+        if snapshot["stages"]:
+            metric = f"{METRIC_PREFIX}_stage_seconds"
+            out.append(f"# HELP {metric} Time spent in each pipeline stage")
+            out.append(f"# TYPE {metric} summary")
+            for stage, summary in snapshot["stages"].items():
+                out.append(f'{metric}_count{{stage="{stage}"}} {summary["count"]}')
+                out.append(f'{metric}_sum{{stage="{stage}"}} {summary["sum"]}')
+            out.append(f"# TYPE {metric}_max gauge")
+            for stage, summary in snapshot["stages"].items():
+                out.append(f'{metric}_max{{stage="{stage}"}} {summary["max"]}')
+        for name, summary in snapshot["values"].items():
+            metric = f"{METRIC_PREFIX}_{name}"
+            out.append(f"# TYPE {metric} summary")
+            out.append(f"{metric}_count {summary['count']}")
+            out.append(f"{metric}_sum {summary['sum']}")
+            out.append(f"# TYPE {metric}_max gauge")
+            out.append(f"{metric}_max {summary['max']}")
+        return "\n".join(out) + "\n"
+
+
+# Process-wide collector used by pdf_processor, heading_extractor and main
+METRICS = Metrics()
+increment = METRICS.increment
+observe = METRICS.observe
+record_stage = METRICS.record_stage
+timer = METRICS.timer
+
+
+def write_atomic(path: str, text: str, mode: int | None = None, prefix: str = ".tmp-"):
+    # Temporary file in the same directory, then rename: readers (e.g. node_exporter's
+    # textfile collector) never see a partial file. mkstemp creates files readable only
+    # by the owner; mode (e.g. FILE_MODE) sets other permissions.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def run_report(documents: list[dict], wall_seconds: float, extra: dict | None = None, slowest: int = 20) -> dict:
+    """
+    Build the JSON run report: aggregated metrics plus one record per document.
+
+    Args:
+        documents: {"file", "status", "seconds"} records, one per processed PDF
+        wall_seconds: Wall-clock duration of the run
+        extra: Additional top-level fields (e.g. pipeline version, options)
+        slowest: Number of slowest documents listed separately
+    """
+    seconds = sorted(d["seconds"] for d in documents)
+
+    def percentile(q):
+        return round(seconds[min(len(seconds) - 1, int(q * len(seconds)))], 4) if seconds else None
+
+    report = dict(extra or {})
+    report.update({
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "wall_seconds": round(wall_seconds, 3),
+        "documents": len(documents),
+        "failed": sum(1 for d in documents if d["status"] != "ok"),
+        "document_seconds": {"p50": percentile(0.5), "p95": percentile(0.95), "max": seconds[-1] if seconds else None},
+        "metrics": METRICS.snapshot(),
+        "slowest": sorted(documents, key=lambda d: d["seconds"], reverse=True)[:slowest],
+        "files": documents,
+    })
+    return report
+
+
+def write_report(path: str, report: dict):
+    write_atomic(path, json.dumps(report, indent=2, ensure_ascii=False), prefix=".metrics-")
+
+
+def write_prometheus(path: str):
+    write_atomic(path, METRICS.to_prometheus(), prefix=".metrics-")
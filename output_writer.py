@@ -0,0 +1,170 @@
+import json
+import os
+import queue
+import threading
+
+import metrics
+
+# Results per file in JSONL mode before the writer starts a new shard
+DEFAULT_SHARD_SIZE = 10000
+JSONL_PREFIX = "outlines-"
+
+
+def output_name_for(pdf_file: str) -> str:
+    """Return the JSON output file name for a PDF file name (any case of the .pdf extension)."""
+    return os.path.splitext(pdf_file)[0] + ".json"
+
+
+def _shard_number(name: str) -> int | None:
+    if name.startswith(JSONL_PREFIX) and name.endswith(".jsonl"):
+        number = name[len(JSONL_PREFIX):-len(".jsonl")]
+        if number.isdigit():
+            return int(number)
+    return None
+
+
+def encode_result(result: dict, pretty: bool = False) -> str:
+    if pretty:
+        return json.dumps(result, indent=2, ensure_ascii=False)
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+
+
+def write_json(path: str, result: dict, pretty: bool = False):
+    # Readers never see a partial output; outputs get the usual umask-based permissions
+    metrics.write_atomic(path, encode_result(result, pretty), metrics.FILE_MODE)
+
+
+class JsonFileWriter:
+    """
+    One JSON file per PDF, written atomically by a background thread.
+
+    write() only queues the result, so extraction continues while the previous
+    outputs are encoded and written; the bounded queue keeps memory flat when
+    the file system is slower than extraction. Errors raised by the thread are
+    re-raised by flush() and close().
+    """
+
+    def __init__(self, output_dir: str, pretty: bool = False, queue_size: int = 256):
+        self.output_dir = output_dir
+        self.pretty = pretty
+        self._queue = queue.Queue(queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="output-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, pdf_file: str, result: dict) -> str:
+        """Queue the result of pdf_file and return the output file name."""
+        self._raise_error()
+        output_file = output_name_for(pdf_file)
+        # Archive members keep their folders (see input_source.py)
+        make_dirs = bool(os.path.dirname(output_file))
+        self._queue.put((os.path.join(self.output_dir, output_file), result, make_dirs))
+        return output_file
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, result, make_dirs = item
+                with metrics.timer("write"):
+                    if make_dirs:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                    write_json(path, result, self.pretty)
+            except Exception as e:
+                if self._error is None:
+                    self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def flush(self):
+        """Wait until every queued result is on disk."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+
+class JsonlWriter:
+    """
+    Append-only bundles of many results per file, one JSON object per line.
+
+    Each line is {"file": <pdf file name>, "title": ..., "outline": [...]}.
+    Every run starts a new shard (outlines-00000.jsonl, outlines-00001.jsonl,
+    ...) after the existing ones and moves on to the next after shard_size
+    results, so existing shards are never rewritten. When a PDF is processed
+    again, the line in the newest shard supersedes the earlier ones.
+    """
+
+    def __init__(self, output_dir: str, shard_size: int = DEFAULT_SHARD_SIZE):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        existing = [n for name in os.listdir(output_dir) if (n := _shard_number(name)) is not None]
+        self._next_shard = max(existing) + 1 if existing else 0
+        self._file = None
+        self._shard_name = None
+        self._written = 0
+
+    def _open_shard(self):
+        self._shard_name = f"{JSONL_PREFIX}{self._next_shard:05d}.jsonl"
+        self._next_shard += 1
+        self._file = open(os.path.join(self.output_dir, self._shard_name), "x", encoding="utf-8")
+        self._written = 0
+
+    def write(self, pdf_file: str, result: dict) -> str:
+        """Append the result of pdf_file and return the name of the shard it went to."""
+        with metrics.timer("write"):
+            if self._file is None or self._written >= self.shard_size:
+                self.close()
+                self._open_shard()
+            self._file.write(encode_result({"file": pdf_file, **result}) + "\n")
+            self._written += 1
+        return self._shard_name
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+def iter_jsonl_results(output_dir: str):
+    """
+    Yield (pdf_file, result) for the latest result of every PDF in the JSONL shards of output_dir.
+
+    A truncated last line (left by an interrupted run) is skipped.
+    """
+    latest = {}
+    shards = sorted((n, name) for name in os.listdir(output_dir) if (n := _shard_number(name)) is not None)
+    for _, name in shards:
+        with open(os.path.join(output_dir, name), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                latest[record.pop("file")] = record
+    yield from latest.items()
+
+
+def open_writer(output_dir: str, output_format: str = "json", pretty: bool = False,
+                shard_size: int = DEFAULT_SHARD_SIZE):
+    # Writer for main's --output-format
+    if output_format == "jsonl":
+        return JsonlWriter(output_dir, shard_size)
+    return JsonFileWriter(output_dir, pretty)
@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+import signal
+import tempfile
+
+import metrics
+from line_table import LineTable
+from pdf_processor import extract_page_range
+
+# Documents with at least this many pages are extracted in page ranges on several processes
+DEFAULT_PAGE_PARALLEL_THRESHOLD = 400
+# Ranges per worker: a little more than one evens out pages of different cost, while every
+# range pays for opening the document again
+RANGES_PER_WORKER = 2
+
+
+def page_ranges(page_count: int, parts: int) -> list[tuple[int, int]]:
+    # Up to `parts` contiguous (start, stop) ranges of near-equal length covering every page
+    parts = max(1, min(parts, page_count))
+    bounds = [page_count * i // parts for i in range(parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def merge_ranges(tables: list[LineTable]) -> LineTable:
+    # Tables of consecutive ranges, in page order, give the same table as serial extraction
+    return tables[0] if len(tables) == 1 else LineTable.concat(tables)
+
+
+def range_source(pdf_path) -> tuple[str, bool]:
+    # Range tasks get a file path, never the PDF's bytes, which would be copied to the
+    # workers once per range: bytes (archive members) are written to a temporary file
+    # once. Returns the path and whether the caller must delete it.
+    if not isinstance(pdf_path, (bytes, bytearray, memoryview)):
+        return pdf_path, False
+    fd, path = tempfile.mkstemp(prefix="pdf-ranges-", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_path)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, True
+
+
+def extract_range_task(pdf_path, start: int, stop: int, lean: bool = False) -> tuple[LineTable, dict]:
+    # Runs in a worker process: the range's lines plus the metrics recorded for it
+    metrics.METRICS.reset()
+    table = extract_page_range(pdf_path, start, stop, lean)
+    return table, metrics.METRICS.snapshot()
+
+
+def _init_page_worker():
+    # Let the parent handle Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class PagePool:
+    """
+    Processes that extract disjoint page ranges of one large document in parallel.
+
+    Passed to extract_text_with_layout, it takes over documents with at least
+    threshold pages: each worker opens the file itself, extracts its ranges, and
+    the ranges are merged in page order, so the result is identical to serial
+    extraction. A document given as bytes is written to a temporary file for
+    the workers (see range_source). The processes are started on first use.
+    """
+
+    def __init__(self, workers: int | None = None, threshold: int = DEFAULT_PAGE_PARALLEL_THRESHOLD):
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self._pool = None
+
+    def wants(self, page_count: int) -> bool:
+        return self.workers > 1 and page_count >= self.threshold
+
+    def extract(self, pdf_path, page_count: int, lean: bool = False) -> LineTable:
+        if self._pool is None:
+            self._pool = multiprocessing.get_context("spawn").Pool(self.workers, initializer=_init_page_worker)
+        ranges = page_ranges(page_count, self.workers * RANGES_PER_WORKER)
+        path, temporary = range_source(pdf_path)
+        try:
+            tasks = [(path, start, stop, lean) for start, stop in ranges]
+            tables = []
+            for table, range_metrics in self._pool.starmap(extract_range_task, tasks):
+                metrics.METRICS.merge(range_metrics)
+                tables.append(table)
+        finally:
+            if temporary:
+                os.unlink(path)
+        metrics.increment("page_parallel_documents")
+        return merge_ranges(tables)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class SplitDocument(Exception):
+    """Raised in a document worker for a document its parent should extract page-parallel."""
+
+    def __init__(self, page_count: int):
+        super().__init__(f"{page_count} pages")
+        self.page_count = page_count
+
+
+class DeferringPagePool:
+    # Stand-in for PagePool inside pool workers, which cannot start processes of their own:
+    # large documents are handed back to the parent, which spreads their page ranges over
+    # the document workers (see main.process_pdfs_parallel)
+    def __init__(self, threshold: int = DEFAULT_PAGE_PARALLEL_THRESHOLD):
+        self.threshold = threshold
+
+    def wants(self, page_count: int) -> bool:
+        return page_count >= self.threshold
+
+    def extract(self, pdf_path, page_count: int, lean: bool = False) -> LineTable:
+        raise SplitDocument(page_count)
@@ -1,39 +1,113 @@
 
+import time
 import fitz # PyMuPDF
+import metrics
+from line_table import LineTableBuilder
 
-def extract_text_with_layout(pdf_path):
-    doc = fitz.open(pdf_path)
-    extracted_data = []
-    for page_num in range(doc.page_count):
-        page = doc[page_num]
-        page_width = page.rect.width
-        page_height = page.rect.height
-        # Use get_text("dict") for detailed block information
+# Bump whenever a change here alters the extracted lines, so cached layouts
+# (see layout_cache.py) are not reused
+EXTRACTOR_VERSION = 1
+
+# Lean mode: the default "dict" flags minus TEXT_PRESERVE_IMAGES, so image blocks
+# (with their decoded pixel data) are never built. Text blocks are unaffected.
+LEAN_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+def open_pdf(pdf_path):
+    # pdf_path is a file path or the PDF's bytes (e.g. an archive member read by input_source)
+    if isinstance(pdf_path, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=pdf_path, filetype="pdf")
+    return fitz.open(pdf_path)
+
+def _add_page_lines(builder, page, page_num, lean=False, collector=metrics.METRICS):
+    builder.set_page(page_num, page.rect.width, page.rect.height)
+    lines_before = len(builder)
+    start = time.perf_counter()
+    # Use get_text("dict") for detailed block information
+    if lean:
+        blocks = page.get_text("dict", flags=LEAN_TEXT_FLAGS)["blocks"]
+    else:
         blocks = page.get_text("dict")["blocks"]
-        for block in blocks:
-            if "lines" in block:
-                for line in block["lines"]:
-                    # Reconstruct text from spans to ensure correct line text
-                    full_line_text = "".join(span["text"] for span in line["spans"]).strip()
-                    if not full_line_text: # Skip empty lines
-                        continue
-                    
-                    # Use the bbox of the entire line for more accurate position
-                    line_bbox = line["bbox"]
-                    # Determine if the line is bold by checking if any span is bold
+    parsed = time.perf_counter()
+    collector.record_stage("get_text", parsed - start)
+    for block in blocks:
+        if "lines" in block:
+            for line in block["lines"]:
+                # Reconstruct text from spans to ensure correct line text
+                full_line_text = "".join(span["text"] for span in line["spans"]).strip()
+                if not full_line_text: # Skip empty lines
+                    continue
+                
+                # Determine if the line is bold by checking if any span is bold
+                if lean:
+                    is_bold = any(span["flags"] & fitz.TEXT_FONT_BOLD for span in line["spans"])
+                else:
                     is_bold = any("bold" in span["font"].lower() for span in line["spans"])
 
-                    extracted_data.append({
-                        "text": full_line_text,
-                        "font_size": line["spans"][0]["size"], # Use first span's font size as representative
-                        "font_name": line["spans"][0]["font"], # Use first span's font name
-                        "bbox": line_bbox,
-                        "page": page_num, # 1-based page number
-                        "page_width": page_width,
-                        "page_height": page_height,
-                        "is_bold": is_bold
-                    })
-    return extracted_data
+                builder.add_line(
+                    full_line_text,
+                    line["spans"][0]["size"], # Use first span's font size as representative
+                    line["spans"][0]["font"], # Use first span's font name
+                    line["bbox"], # Use the bbox of the entire line for more accurate position
+                    is_bold
+                )
+    collector.record_stage("build_lines", time.perf_counter() - parsed)
+    collector.observe("lines_per_page", len(builder) - lines_before)
+    collector.increment("pages")
+
+def extract_text_with_layout(pdf_path, lean=False, page_pool=None):
+    # lean=True skips image blocks and takes bold from the span flags instead of the font name.
+    # A page_pool (see page_parallel.py) takes over documents with many pages.
+    with metrics.timer("open"):
+        doc = open_pdf(pdf_path)
+    if page_pool is not None and page_pool.wants(doc.page_count):
+        page_count = doc.page_count
+        doc.close()
+        return page_pool.extract(pdf_path, page_count, lean)
+    builder = LineTableBuilder()
+    for page_num in range(doc.page_count):
+        _add_page_lines(builder, doc[page_num], page_num, lean)
+    # Columnar LineTable; iterating it yields dict-style views of each line
+    return builder.build()
+
+def extract_page_range(pdf_path, start, stop, lean=False):
+    # LineTable of pages start..stop-1, for page-parallel extraction; every range opens the file itself
+    with metrics.timer("open"):
+        doc = open_pdf(pdf_path)
+    with doc:
+        builder = LineTableBuilder()
+        for page_num in range(start, min(stop, doc.page_count)):
+            _add_page_lines(builder, doc[page_num], page_num, lean)
+    return builder.build()
+
+def extract_leading_pages(pdf_path, lean=False, max_pages=None, should_stop=None):
+    # extract_text_with_layout for at most max_pages pages, stopping before the next page
+    # once should_stop() returns True (the first page is always extracted). Returns the
+    # LineTable and the document's page count, so callers can tell whether pages were left out.
+    with metrics.timer("open"):
+        doc = open_pdf(pdf_path)
+    with doc:
+        builder = LineTableBuilder()
+        page_count = doc.page_count
+        for page_num in range(page_count if max_pages is None else min(page_count, max_pages)):
+            if page_num and should_stop is not None and should_stop():
+                break
+            _add_page_lines(builder, doc[page_num], page_num, lean)
+    return builder.build(), page_count
+
+def page_with_layout(doc, page_num, lean=False, collector=metrics.METRICS):
+    # LineTable of a single page of an open document; its page metrics go to collector
+    builder = LineTableBuilder()
+    _add_page_lines(builder, doc[page_num], page_num, lean, collector)
+    return builder.build()
+
+def iter_pages_with_layout(pdf_path, lean=False):
+    # Streaming variant of extract_text_with_layout: yields one LineTable per page,
+    # so only the page being processed is held in memory
+    with metrics.timer("open"):
+        doc = open_pdf(pdf_path)
+    with doc:
+        for page_num in range(doc.page_count):
+            yield page_with_layout(doc, page_num, lean)
 
 if __name__ == "__main__":
     # Example usage (for testing purposes)
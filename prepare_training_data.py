@@ -1,26 +1,34 @@
+import argparse
 import os
 import json
-from pdf_processor import extract_text_with_layout
-from heading_extractor import clean_text
+import multiprocessing
+import numpy as np
+from heading_extractor import build_feature_matrix, clean_text
+from layout_cache import LayoutCache, extract_with_cache
+from training_dataset import DEFAULT_DATASET_DIR, TrainingDataset, shard_key, write_shard
 
-def prepare_data(pdf_dir, json_dir):
-    training_data = []
-    pdf_files = [f for f in os.listdir(pdf_dir) if f.endswith(".pdf")]
-
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(pdf_dir, pdf_file)
-        json_file = pdf_file.replace(".pdf", ".json")
-        json_path = os.path.join(json_dir, json_file)
+def ground_truth_texts(json_path):
+    with open(json_path, "r", encoding="utf-8") as f:
+        ground_truth = json.load(f)
+    return {clean_text(item["text"]) for item in ground_truth.get("outline", [])}
 
+def find_documents(pdf_dir, json_dir):
+    # (pdf_file, pdf_path, json_path) for every PDF that has a ground truth JSON
+    documents = []
+    for pdf_file in sorted(f for f in os.listdir(pdf_dir) if f.endswith(".pdf")):
+        json_path = os.path.join(json_dir, pdf_file.replace(".pdf", ".json"))
         if not os.path.exists(json_path):
             print(f"Warning: Ground truth JSON not found for {pdf_file}. Skipping.")
             continue
+        documents.append((pdf_file, os.path.join(pdf_dir, pdf_file), json_path))
+    return documents
 
-        extracted_lines = extract_text_with_layout(pdf_path)
-        with open(json_path, "r", encoding="utf-8") as f:
-            ground_truth = json.load(f)
-
-        gt_outline_texts = {clean_text(item["text"]) for item in ground_truth.get("outline", [])}
+def prepare_data(pdf_dir, json_dir, cache=None):
+    # Per-line records for ad hoc inspection; training reads the columnar dataset from build_dataset
+    training_data = []
+    for _, pdf_path, json_path in find_documents(pdf_dir, json_dir):
+        extracted_lines = extract_with_cache(pdf_path, cache)
+        gt_outline_texts = ground_truth_texts(json_path)
 
         for line in extracted_lines:
             cleaned_line_text = clean_text(line["text"])
@@ -41,14 +49,98 @@ def prepare_data(pdf_dir, json_dir):
 
     return training_data
 
+def document_columns(pdf_path, json_path, cache=None):
+    # Features, labels and pages of one document as arrays, labelled as in prepare_data
+    table = extract_with_cache(pdf_path, cache)
+    gt_outline_texts = ground_truth_texts(json_path)
+    # Line texts are interned, so each distinct text is cleaned once
+    is_heading = {}
+    for text in table.text:
+        if text not in is_heading:
+            is_heading[text] = clean_text(text) in gt_outline_texts
+    labels = np.fromiter((is_heading[text] for text in table.text), dtype=np.int8, count=len(table))
+    return build_feature_matrix(table), labels, table.page
+
+def _build_shard(dataset_dir, pdf_file, pdf_path, json_path, key, cache):
+    try:
+        features, labels, pages = document_columns(pdf_path, json_path, cache)
+        write_shard(dataset_dir, key, features, labels, pages)
+    except Exception as e:
+        return pdf_file, key, None, f"{type(e).__name__}: {e}"
+    return pdf_file, key, (len(labels), int(labels.sum())), None
+
+def _star_build_shard(task):
+    return _build_shard(*task)
+
+def build_dataset(pdf_dir, json_dir, dataset_dir=DEFAULT_DATASET_DIR, workers=None, cache=None):
+    """
+    Extract every annotated PDF into the sharded training dataset in dataset_dir.
+
+    Documents whose PDF and ground truth are unchanged since the last run keep
+    their shard; new or changed ones are extracted in parallel, and documents
+    that are no longer in pdf_dir are dropped.
+
+    Args:
+        pdf_dir: Directory of training PDFs
+        json_dir: Directory of ground truth JSON files with the same base names
+        dataset_dir: Dataset directory (created if missing)
+        workers: Worker processes (default: CPU count)
+        cache: Optional LayoutCache shared with the other entry points
+
+    Returns:
+        The updated TrainingDataset
+    """
+    dataset = TrainingDataset(dataset_dir)
+    documents = find_documents(pdf_dir, json_dir)
+    present = {pdf_file for pdf_file, _, _ in documents}
+    for pdf_file in list(dataset.documents):
+        if pdf_file not in present:
+            dataset.forget(pdf_file)
+
+    tasks = []
+    for pdf_file, pdf_path, json_path in documents:
+        key = shard_key(pdf_path, json_path)
+        if dataset.needs_update(pdf_file, key):
+            tasks.append((dataset_dir, pdf_file, pdf_path, json_path, key, cache))
+    print(f"{len(documents) - len(tasks)} documents unchanged, {len(tasks)} to extract")
+
+    if tasks:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+        if workers == 1:
+            results = map(_star_build_shard, tasks)
+            pool = None
+        else:
+            pool = multiprocessing.get_context("spawn").Pool(workers)
+            results = pool.imap_unordered(_star_build_shard, tasks)
+        try:
+            for pdf_file, key, counts, error in results:
+                if error is not None:
+                    print(f"Error extracting {pdf_file}: {error}")
+                    dataset.forget(pdf_file)
+                    continue
+                dataset.record(pdf_file, key, *counts)
+                # Saved as shards arrive, so an interrupted run keeps its progress
+                dataset.save()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    dataset.save()
+    dataset.prune()
+    return dataset
+
 if __name__ == "__main__":
-    pdf_directory = "/home/ubuntu/Adobe-India-Hackathon25/Challenge_1a/sample_dataset/pdfs"
-    json_directory = "/home/ubuntu/Adobe-India-Hackathon25/Challenge_1a/sample_dataset/outputs"
-    
-    data = prepare_data(pdf_directory, json_directory)
-    print(f"Prepared {len(data)} data points.")
-    # You can save this data to a file for later use
-    with open("training_data.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    print("Training data saved to training_data.json")
+    parser = argparse.ArgumentParser(description="Build the columnar training dataset from annotated PDFs")
+    parser.add_argument("pdf_dir", nargs="?", default="/home/ubuntu/Adobe-India-Hackathon25/Challenge_1a/sample_dataset/pdfs")
+    parser.add_argument("json_dir", nargs="?", default="/home/ubuntu/Adobe-India-Hackathon25/Challenge_1a/sample_dataset/outputs")
+    parser.add_argument("--dataset-dir", default=DEFAULT_DATASET_DIR,
+                        help=f"Output dataset directory (default: {DEFAULT_DATASET_DIR})")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the persistent layout cache")
+    args = parser.parse_args()
 
+    # Reuse extracted layouts across runs; the cache is keyed by PDF content and extractor version
+    dataset = build_dataset(args.pdf_dir, args.json_dir, args.dataset_dir, args.workers,
+                            cache=None if args.no_cache else LayoutCache())
+    print(f"Dataset in {args.dataset_dir}: {len(dataset.documents)} documents, {dataset.rows} lines")
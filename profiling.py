@@ -0,0 +1,378 @@
+import cProfile
+import heapq
+import importlib.util
+import json
+import marshal
+import os
+import pstats
+import re
+import sysconfig
+
+from metrics import write_atomic
+
+# Documents whose full profiles are kept per run
+DEFAULT_PROFILE_TOP = 10
+# Sampling interval of pyinstrument in seconds
+SAMPLE_INTERVAL = 0.001
+PROFILERS = ("auto", "cprofile", "pyinstrument")
+# Functions listed in the hot-function summary
+HOT_FUNCTIONS = 40
+# cProfile stacks carrying less than this share of the profiled time (and at least
+# MIN_STACK_SECONDS) are cut short at the function, which bounds the number of stacks
+# (see _cprofile_stacks)
+MIN_STACK_SHARE = 1e-4
+MIN_STACK_SECONDS = 1e-4
+MAX_STACK_DEPTH = 64
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+_STDLIB_DIR = sysconfig.get_paths()["stdlib"]
+# Top-level packages reported as their own code area; other installed packages are "third_party"
+PACKAGE_AREAS = {"fitz": "pymupdf", "pymupdf": "pymupdf", "numpy": "numpy", "pandas": "pandas",
+                 "xgboost": "xgboost", "sklearn": "sklearn", "joblib": "joblib"}
+# Modules of this repository reported as their own code area; the others are "project"
+PROJECT_AREAS = ("pdf_processor", "heading_extractor")
+
+
+def resolve_profiler(profiler: str = "auto") -> str:
+    # auto: the pyinstrument sampling profiler when it is installed, cProfile otherwise
+    if profiler == "auto":
+        return "pyinstrument" if importlib.util.find_spec("pyinstrument") is not None else "cprofile"
+    return profiler
+
+
+def _site_package(file_path: str) -> str | None:
+    # Top-level package of a file installed under site-packages or dist-packages
+    parts = file_path.replace("\\", "/").split("/")
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            rest = parts[parts.index(marker) + 1:]
+            return os.path.splitext(rest[0])[0] if rest else None
+    return None
+
+
+def code_area(file_path: str) -> str:
+    """Return the code area of a source file: pdf_processor, heading_extractor, project, a package or stdlib."""
+    package = _site_package(file_path)
+    if package is not None:
+        return PACKAGE_AREAS.get(package.lower(), "third_party")
+    path = os.path.abspath(file_path)
+    if os.path.dirname(path) == _PROJECT_DIR:
+        module = os.path.splitext(os.path.basename(path))[0]
+        return module if module in PROJECT_AREAS else "project"
+    if path.startswith(_STDLIB_DIR) or file_path.startswith("<frozen"):
+        return "stdlib"
+    return "other"
+
+
+def _short_path(file_path: str) -> str:
+    parts = file_path.replace("\\", "/").split("/")
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            return "/".join(parts[parts.index(marker) + 1:])
+    path = os.path.abspath(file_path)
+    for root in (_PROJECT_DIR, _STDLIB_DIR):
+        if path.startswith(root + os.sep):
+            return os.path.relpath(path, root)
+    return os.path.basename(file_path)
+
+
+def _builtin_label(name: str) -> str:
+    # Without the object address, so the same C function has one label in every process
+    return re.sub(r" at 0x[0-9a-f]+", "", name).replace(";", ",")
+
+
+def _frame_label(name: str, file_path: str, line: int) -> str:
+    # Collapsed-stack frames are separated by ";"
+    return f"{name} ({_short_path(file_path)}:{line})".replace(";", ",")
+
+
+class DocumentProfile:
+    """
+    Profile of one document, small enough to send back from a worker process.
+
+    functions maps a function label to [area, calls, self seconds, cumulative
+    seconds] (calls is 0 for sampled profiles), stacks maps collapsed stacks
+    ("outer;...;inner") to self seconds, and raw is the profiler's own data
+    (pstats entries for cProfile, the session for pyinstrument) that is saved
+    for the slowest documents. Profiles of the parts of a document processed
+    in different processes are merge()d.
+    """
+
+    def __init__(self, pdf_file: str, profiler: str, seconds: float = 0.0, status: str = "ok",
+                 functions: dict | None = None, stacks: dict | None = None, raw=None):
+        self.pdf_file = pdf_file
+        self.profiler = profiler
+        self.seconds = seconds
+        self.status = status
+        self.functions = functions or {}
+        self.stacks = stacks or {}
+        self.raw = raw
+
+    def merge(self, other: "DocumentProfile"):
+        _merge_functions(self.functions, other.functions)
+        _merge_stacks(self.stacks, other.stacks)
+        if other.status != "ok":
+            self.status = other.status
+        if self.raw is None:
+            self.raw = other.raw
+        elif other.raw is not None:
+            if self.profiler == "cprofile":
+                for func, stat in other.raw.items():
+                    self.raw[func] = pstats.add_func_stats(self.raw[func], stat) if func in self.raw else stat
+            else:
+                from pyinstrument.session import Session
+                self.raw = Session.combine(Session.from_json(self.raw), Session.from_json(other.raw)).to_json()
+
+
+def _merge_functions(target: dict, source: dict):
+    for label, (area, calls, self_seconds, cumulative) in source.items():
+        entry = target.get(label)
+        if entry is None:
+            target[label] = [area, calls, self_seconds, cumulative]
+        else:
+            entry[1] += calls
+            entry[2] += self_seconds
+            entry[3] += cumulative
+
+
+def _merge_stacks(target: dict, source: dict):
+    for stack, seconds in source.items():
+        target[stack] = target.get(stack, 0.0) + seconds
+
+
+def _cprofile_functions(stats: dict) -> tuple[dict, dict]:
+    # Labels and function table of pstats entries; C functions ("~" file) belong to the
+    # area of the package they come from, or else to the area of the caller that spent
+    # the most time in them, so e.g. list.append in our loops counts as our code
+    labels, areas = {}, {}
+    for func in stats:
+        file_path, line, name = func
+        if file_path == "~":
+            labels[func] = _builtin_label(name)
+            package = next((p for p in PACKAGE_AREAS if f" {p}." in name or f"'{p}." in name), None)
+            if package is not None:
+                areas[func] = PACKAGE_AREAS[package]
+        else:
+            labels[func] = _frame_label(name, file_path, line)
+            areas[func] = code_area(file_path)
+    for func, (_, _, _, _, callers) in stats.items():
+        if func not in areas:
+            heaviest = max(callers, key=lambda caller: callers[caller][3], default=None)
+            areas[func] = areas.get(heaviest, "builtins")
+    functions = {
+        labels[func]: [areas[func], calls, self_seconds, cumulative]
+        for func, (_, calls, self_seconds, cumulative, _) in stats.items()
+    }
+    return labels, functions
+
+
+def _cprofile_stacks(stats: dict, labels: dict) -> dict:
+    # cProfile records caller -> callee edges, not stacks. Each function's own time is spread
+    # over its callers in proportion to the time each edge accounts for, recursively up to
+    # the outermost call. Paths whose time drops below the cut-off, or that recurse or get
+    # too deep, end early, so the stacks always add up to the profiled time.
+    stacks = {}
+    cutoff = max(MIN_STACK_SECONDS, MIN_STACK_SHARE * sum(stat[2] for stat in stats.values()))
+
+    def paths(func, seconds, seen, depth):
+        callers = {caller: edge for caller, edge in stats[func][4].items() if caller in stats and caller not in seen}
+        total = sum(edge[3] for edge in callers.values())
+        if not callers or total <= 0 or seconds < cutoff or depth >= MAX_STACK_DEPTH:
+            yield (labels[func],), seconds
+            return
+        for caller, edge in callers.items():
+            for path, share in paths(caller, seconds * edge[3] / total, seen | {func}, depth + 1):
+                yield path + (labels[func],), share
+
+    for func, (_, _, self_seconds, _, _) in stats.items():
+        if self_seconds > 0:
+            for path, seconds in paths(func, self_seconds, frozenset(), 0):
+                stack = ";".join(path)
+                stacks[stack] = stacks.get(stack, 0.0) + seconds
+    return stacks
+
+
+def _pyinstrument_profile(session) -> tuple[dict, dict]:
+    # Functions and stacks from the sampled call tree; synthetic frames (e.g. [self]) are
+    # folded into their parent's own time, and C functions belong to their caller's area
+    functions, stacks = {}, {}
+
+    def walk(frame, path, on_stack, parent_area):
+        file_path = frame.file_path or ""
+        builtin = not file_path or file_path.startswith("<built-in")
+        label = _builtin_label(frame.function) if builtin else _frame_label(frame.function, file_path, frame.line_no or 0)
+        area = parent_area if builtin else code_area(file_path)
+        children = [child for child in frame.children if not child.is_synthetic]
+        self_seconds = max(0.0, frame.time - sum(child.time for child in children))
+        entry = functions.setdefault(label, [area, 0, 0.0, 0.0])
+        entry[2] += self_seconds
+        if label not in on_stack:
+            # Recursive calls are already inside the outer call's cumulative time
+            entry[3] += frame.time
+        path = path + (label,)
+        if self_seconds > 0:
+            stack = ";".join(path)
+            stacks[stack] = stacks.get(stack, 0.0) + self_seconds
+        for child in children:
+            walk(child, path, on_stack | {label}, area)
+
+    root = session.root_frame()
+    if root is not None:
+        walk(root, (), frozenset(), "other")
+    return functions, stacks
+
+
+class DocumentProfiler:
+    """Profiles the code run between start() and stop() with cProfile or pyinstrument."""
+
+    def __init__(self, profiler: str = "cprofile"):
+        self.profiler = resolve_profiler(profiler)
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+            self._profiler = Profiler(interval=SAMPLE_INTERVAL)
+        else:
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        if self.profiler == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.profiler == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def profile(self, pdf_file: str, seconds: float, status: str = "ok") -> DocumentProfile:
+        """Turn the recorded data into a DocumentProfile (after stop())."""
+        if self.profiler == "pyinstrument":
+            session = self._profiler.last_session
+            functions, stacks = _pyinstrument_profile(session)
+            raw = session.to_json()
+        else:
+            raw = pstats.Stats(self._profiler).stats
+            labels, functions = _cprofile_functions(raw)
+            stacks = _cprofile_stacks(raw, labels)
+        return DocumentProfile(pdf_file, self.profiler, seconds, status, functions, stacks, raw)
+
+
+def _write_collapsed(path: str, stacks: dict):
+    # One "frame;frame;frame count" line per stack, counts in microseconds, as read by
+    # flamegraph.pl, inferno and speedscope
+    lines = [f"{stack} {round(seconds * 1e6)}" for stack, seconds in sorted(stacks.items()) if round(seconds * 1e6)]
+    write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _safe_name(pdf_file: str) -> str:
+    return pdf_file.replace("\\", "/").replace("/", "__")
+
+
+class ProfileCollector:
+    """
+    Profiles of the documents of a run.
+
+    Every document's functions and stacks are added to run-wide totals, and the
+    full profiles of the `top` slowest documents are kept (a heap, so at most
+    top profiles are held). write() saves into output_dir:
+
+        hot_functions.txt   self time by code area and the hottest functions
+        summary.json        the same, machine-readable
+        all.collapsed       collapsed stacks of all documents
+        slowest/NN-<file>.collapsed and .pstats / .pyisession for the slowest documents
+    """
+
+    def __init__(self, output_dir: str, top: int = DEFAULT_PROFILE_TOP, profiler: str = "auto"):
+        self.output_dir = output_dir
+        self.top = top
+        self.profiler = resolve_profiler(profiler)
+        self.documents = 0
+        self.seconds = 0.0
+        self.functions = {}
+        self.stacks = {}
+        self._slowest = []
+        self._added = 0
+
+    def add(self, profile: DocumentProfile):
+        self.documents += 1
+        self.seconds += profile.seconds
+        _merge_functions(self.functions, profile.functions)
+        _merge_stacks(self.stacks, profile.stacks)
+        self._added += 1
+        entry = (profile.seconds, self._added, profile)
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, entry)
+        elif self.top and entry > self._slowest[0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def slowest(self) -> list[DocumentProfile]:
+        return [profile for _, _, profile in sorted(self._slowest, reverse=True)]
+
+    def areas(self) -> dict[str, float]:
+        """Self seconds per code area, largest first."""
+        totals = {}
+        for area, _, self_seconds, _ in self.functions.values():
+            totals[area] = totals.get(area, 0.0) + self_seconds
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def summary(self) -> dict:
+        areas = self.areas()
+        total = sum(areas.values()) or 1.0
+        hottest = sorted(self.functions.items(), key=lambda item: -item[1][2])[:HOT_FUNCTIONS]
+        return {
+            "profiler": self.profiler,
+            "documents": self.documents,
+            "document_seconds": round(self.seconds, 6),
+            "areas": {area: {"self_seconds": round(seconds, 6), "share": round(seconds / total, 4)}
+                      for area, seconds in areas.items()},
+            "functions": [
+                {"function": label, "area": area, "calls": calls, "self_seconds": round(self_seconds, 6),
+                 "cumulative_seconds": round(cumulative, 6)}
+                for label, (area, calls, self_seconds, cumulative) in hottest
+            ],
+            "slowest": [{"file": p.pdf_file, "seconds": round(p.seconds, 4), "status": p.status}
+                        for p in self.slowest()],
+        }
+
+    def report(self) -> str:
+        summary = self.summary()
+        lines = [f"Profiled {summary['documents']} documents ({summary['document_seconds']:.2f}s) "
+                 f"with {self.profiler}; full profiles of the {len(summary['slowest'])} slowest in slowest/", "",
+                 "Self time by code area:"]
+        for area, entry in summary["areas"].items():
+            lines.append(f"  {area:<18} {entry['self_seconds']:>10.3f}s {entry['share'] * 100:>6.1f}%")
+        lines += ["", "Hottest functions by self time:",
+                  f"  {'self s':>10} {'cum s':>10} {'calls':>9}  {'area':<18} function"]
+        for entry in summary["functions"]:
+            lines.append(f"  {entry['self_seconds']:>10.3f} {entry['cumulative_seconds']:>10.3f} "
+                         f"{entry['calls'] or '-':>9}  {entry['area']:<18} {entry['function']}")
+        lines += ["", "Slowest documents:"]
+        lines += [f"  {entry['seconds']:>10.3f}s  {entry['file']} [{entry['status']}]" for entry in summary["slowest"]]
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        slowest_dir = os.path.join(self.output_dir, "slowest")
+        os.makedirs(slowest_dir, exist_ok=True)
+        write_atomic(os.path.join(self.output_dir, "hot_functions.txt"), self.report())
+        write_atomic(os.path.join(self.output_dir, "summary.json"), json.dumps(self.summary(), indent=2))
+        _write_collapsed(os.path.join(self.output_dir, "all.collapsed"), self.stacks)
+        written = set()
+        for rank, profile in enumerate(self.slowest(), 1):
+            base = os.path.join(slowest_dir, f"{rank:02d}-{_safe_name(profile.pdf_file)}")
+            _write_collapsed(base + ".collapsed", profile.stacks)
+            written.add(base + ".collapsed")
+            if profile.profiler == "cprofile":
+                # The format of pstats.Stats.dump_stats, readable with pstats or snakeviz
+                with open(base + ".pstats", "wb") as f:
+                    marshal.dump(profile.raw, f)
+                written.add(base + ".pstats")
+            else:
+                # Open with: pyinstrument --load <file>
+                write_atomic(base + ".pyisession", json.dumps(profile.raw))
+                written.add(base + ".pyisession")
+        # Profiles that dropped out of the slowest (watch mode rewrites after every poll)
+        for name in os.listdir(slowest_dir):
+            path = os.path.join(slowest_dir, name)
+            if path not in written:
+                os.unlink(path)
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Long-running extraction service.
+
+Keeps the interpreter, imports and model warm and serves process_pdf over HTTP,
+either on a TCP port or on a local Unix socket.
+
+Endpoints:
+    POST /process   body {"path": "/abs/path/file.pdf"}; returns {"title": ..., "outline": [...]}
+    GET  /health    queue depth, counters, request latency percentiles and batching statistics
+    GET  /metrics   per-stage timings and pipeline counters in Prometheus text format
+
+Requests go into a bounded queue served by a pool of worker threads. When the
+queue is full the service answers 503 with Retry-After instead of queueing
+more work. Line features from documents processed concurrently are gathered by
+a micro-batcher and scored with a single predict call.
+
+Usage:
+    python service.py serve [--port 8080 | --unix-socket /tmp/pdf-outline.sock] [--workers 4]
+    python service.py client input/ [--port 8080 | --unix-socket PATH] [--concurrency 4]
+"""
+
+import argparse
+import collections
+import http.client
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import metrics
+from heading_extractor import Prefilter, load_model, set_prefilter
+from layout_cache import LayoutCache
+from main import extract_outline
+from output_writer import output_name_for, write_json
+
+# Latencies kept for the percentiles reported by /health
+LATENCY_WINDOW = 1000
+
+
+class MicroBatcher:
+    """
+    Model wrapper that merges concurrent predict calls into one.
+
+    predict() blocks until its rows have been scored. The batching thread takes
+    the first pending request, then keeps collecting requests for up to
+    max_wait seconds or until max_rows rows are gathered, scores them with a
+    single model.predict call and hands each caller its slice. Predictions are
+    per row, so results are identical to calling the model directly.
+    """
+
+    def __init__(self, model, max_rows: int = 16384, max_wait: float = 0.002):
+        self.model = model
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.batches = 0
+        self.batched_requests = 0
+        self.batched_rows = 0
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def predict(self, feature_matrix: np.ndarray) -> np.ndarray:
+        future = Future()
+        self._requests.put((feature_matrix, future))
+        return future.result()
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            batch = [request]
+            rows = len(request[0])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    # Score what we have, then stop
+                    self._requests.put(None)
+                    break
+                batch.append(request)
+                rows += len(request[0])
+            self._score(batch, rows)
+
+    def _score(self, batch, rows):
+        try:
+            predictions = self.model.predict(np.concatenate([feature_matrix for feature_matrix, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.batched_requests += len(batch)
+        self.batched_rows += rows
+        start = 0
+        for feature_matrix, future in batch:
+            future.set_result(predictions[start:start + len(feature_matrix)])
+            start += len(feature_matrix)
+
+
+class ExtractionService:
+    """Bounded request queue, worker threads and statistics behind the HTTP handler."""
+
+    def __init__(self, workers: int = 4, queue_size: int = 64, cache: LayoutCache | None = None,
+                 max_batch_rows: int = 16384, max_batch_wait: float = 0.002):
+        model = load_model()
+        self.batcher = MicroBatcher(model, max_batch_rows, max_batch_wait) if model is not None else None
+        self.cache = cache
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.started = time.time()
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, pdf_path: str) -> Future | None:
+        """Queue a PDF for processing; returns None when the queue is full."""
+        future = Future()
+        try:
+            self.jobs.put_nowait((pdf_path, future, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return None
+        return future
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            pdf_path, future, queued_at = job
+            with self._lock:
+                self.in_flight += 1
+            try:
+                result = extract_outline(pdf_path, cache=self.cache, model=self.batcher)
+            except Exception as e:
+                future.set_exception(e)
+                ok = False
+            else:
+                future.set_result(result)
+                ok = True
+            with self._lock:
+                self.in_flight -= 1
+                if ok:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+                self.latencies.append(time.monotonic() - queued_at)
+
+    def health(self) -> dict:
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000
+            report = {
+                "status": "ok",
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "queue_depth": self.jobs.qsize(),
+                "queue_capacity": self.jobs.maxsize,
+                "workers": len(self._workers),
+                "in_flight": self.in_flight,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+        if len(latencies):
+            report["latency_ms"] = {
+                "p50": round(float(np.percentile(latencies, 50)), 2),
+                "p95": round(float(np.percentile(latencies, 95)), 2),
+                "p99": round(float(np.percentile(latencies, 99)), 2),
+                "mean": round(float(latencies.mean()), 2),
+                "window": len(latencies),
+            }
+        if self.batcher is not None and self.batcher.batches:
+            report["batching"] = {
+                "batches": self.batcher.batches,
+                "documents_per_batch": round(self.batcher.batched_requests / self.batcher.batches, 2),
+                "rows_per_batch": round(self.batcher.batched_rows / self.batcher.batches, 1),
+            }
+        else:
+            report["batching"] = {"batches": 0, "model": "loaded" if self.batcher else "heuristics only"}
+        return report
+
+    def close(self):
+        for _ in self._workers:
+            self.jobs.put(None)
+        for worker in self._workers:
+            worker.join()
+        if self.batcher is not None:
+            self.batcher.close()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    request_timeout = 120.0
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.server.service.health())
+        elif self.path == "/metrics":
+            body = metrics.METRICS.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/process":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            pdf_path = json.loads(self.rfile.read(length))["path"]
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {"error": 'expected a JSON body {"path": "..."}'})
+            return
+
+        future = self.server.service.submit(pdf_path)
+        if future is None:
+            self._send_json(503, {"error": "queue full"}, {"Retry-After": "1"})
+            return
+        try:
+            result = future.result(timeout=self.request_timeout)
+        except FutureTimeout:
+            # Not the builtin TimeoutError before Python 3.11 (the image runs 3.10)
+            self._send_json(504, {"error": f"not finished within {self.request_timeout:g}s"})
+        except Exception as e:
+            self._send_json(422, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            self._send_json(200, result)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        # Per-request logging is too noisy for a batch service; see /health instead
+        pass
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(args):
+    cache = LayoutCache(args.cache_dir) if args.cache_dir else None
+    if args.prefilter:
+        set_prefilter(Prefilter(min_size_ratio=args.prefilter_size_ratio))
+    service = ExtractionService(args.workers, args.queue_size, cache, args.max_batch_rows, args.max_batch_wait / 1000)
+    RequestHandler.request_timeout = args.request_timeout
+
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+        server = UnixHTTPServer(args.unix_socket, RequestHandler)
+        where = args.unix_socket
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    server.service = service
+
+    # Stop cleanly on SIGTERM (e.g. docker stop) as well as Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f"Serving on {where} with {args.workers} workers (queue size {args.queue_size})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = 300):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connect(args) -> http.client.HTTPConnection:
+    if args.unix_socket:
+        return UnixHTTPConnection(args.unix_socket)
+    return http.client.HTTPConnection(args.host, args.port, timeout=300)
+
+
+def _request(args, method: str, path: str, payload: dict | None = None) -> tuple[int, dict]:
+    connection = _connect(args)
+    try:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def run_client(args):
+    """Send every PDF in a directory to the service concurrently and report latencies."""
+    pdf_paths = sorted(
+        os.path.abspath(os.path.join(args.input_dir, f))
+        for f in os.listdir(args.input_dir) if f.lower().endswith(".pdf")
+    )
+    if not pdf_paths:
+        print(f"No PDF files found in {args.input_dir}")
+        return
+
+    def process(pdf_path):
+        start = time.perf_counter()
+        while True:
+            status, result = _request(args, "POST", "/process", {"path": pdf_path})
+            if status != 503:
+                return pdf_path, status, result, time.perf_counter() - start
+            # Backpressure: wait and retry
+            time.sleep(0.1)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(process, pdf_paths))
+    total = time.perf_counter() - start
+
+    for pdf_path, status, result, elapsed in results:
+        summary = f"{len(result['outline'])} headings, title {result['title']!r}" if status == 200 else result.get("error")
+        print(f"{os.path.basename(pdf_path)}: HTTP {status} in {elapsed * 1000:.0f} ms - {summary}")
+        if args.output_dir and status == 200:
+            os.makedirs(args.output_dir, exist_ok=True)
+            write_json(os.path.join(args.output_dir, output_name_for(os.path.basename(pdf_path))), result)
+
+    print(f"\n{len(pdf_paths)} PDFs in {total:.2f} seconds ({len(pdf_paths) / total:.1f} PDFs/s)")
+    _, health = _request(args, "GET", "/health")
+    print(json.dumps(health, indent=2))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PDF outline extraction service.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("serve", "client"):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument("--host", default="127.0.0.1", help="Host to bind or connect to (default: 127.0.0.1)")
+        subparser.add_argument("--port", type=int, default=8080, help="TCP port (default: 8080)")
+        subparser.add_argument("--unix-socket", default=None, help="Use this Unix socket instead of TCP")
+
+    serve_parser = subparsers.choices["serve"]
+    serve_parser.add_argument("--workers", type=int, default=4, help="Worker threads (default: 4)")
+    serve_parser.add_argument("--queue-size", type=int, default=64,
+                              help="Requests that may wait for a worker before new ones get 503 (default: 64)")
+    serve_parser.add_argument("--request-timeout", type=float, default=120.0,
+                              help="Seconds a request may take before the service answers 504 (default: 120)")
+    serve_parser.add_argument("--max-batch-rows", type=int, default=16384,
+                              help="Upper bound on line rows per model call (default: 16384)")
+    serve_parser.add_argument("--max-batch-wait", type=float, default=2.0,
+                              help="Milliseconds to wait for other documents' rows before scoring (default: 2)")
+    serve_parser.add_argument("--cache-dir", default=None, help="Directory of the on-disk layout cache")
+    serve_parser.add_argument("--prefilter", action="store_true",
+                              help="Only score lines that pass the cheap layout prefilter with the model")
+    serve_parser.add_argument("--prefilter-size-ratio", type=float, default=Prefilter().min_size_ratio,
+                              help="Prefilter font size ratio to the page median (default: %(default)s)")
+
+    client_parser = subparsers.choices["client"]
+    client_parser.add_argument("input_dir", help="Directory containing PDF files to send")
+    client_parser.add_argument("--concurrency", type=int, default=4, help="Concurrent requests (default: 4)")
+    client_parser.add_argument("--output-dir", default=None, help="Also save each result as JSON here")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        run_client(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
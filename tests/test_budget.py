@@ -0,0 +1,49 @@
+import itertools
+
+import pytest
+
+import budget
+from benchmark import generate_pdf
+from budget import FULL, HEURISTIC, PAGES_CAPPED, TITLE_ONLY, Budget, BudgetClock, budgeted_outline
+
+PAGES = 60
+
+
+@pytest.fixture(scope="module")
+def long_pdf(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("budget") / "long.pdf")
+    generate_pdf(path, PAGES, 30, 0.1, 3, seed=1)
+    return path
+
+
+def use_stepping_clock(monkeypatch, step):
+    # Every look at the clock uses another `step` of the budget: one per page extracted
+    # after the first, then one after the title
+    calls = itertools.count(1)
+    monkeypatch.setattr(BudgetClock, "used", lambda self: next(calls) * step)
+
+
+def test_thresholds_degrade_in_order():
+    assert 0 < budget.EXTRACT_SHARE < budget.HEURISTIC_SHARE < 1
+
+
+@pytest.mark.parametrize("step, level", [
+    (0.0, FULL),
+    # Extraction stops after 8 pages at 0.4 of the budget; 0.45 is left for the model
+    (0.05, PAGES_CAPPED),
+    # Two pages take 0.6, the title 0.9: levels come from the heuristics
+    (0.3, HEURISTIC),
+    (1.0, TITLE_ONLY),
+])
+def test_each_stage_is_reached(monkeypatch, long_pdf, step, level):
+    use_stepping_clock(monkeypatch, step)
+    title, outline, used_level = budgeted_outline(long_pdf, Budget(seconds=1.0))
+    assert used_level == level
+    assert (outline == []) == (level == TITLE_ONLY)
+
+
+def test_real_budgets_on_a_long_pdf(long_pdf):
+    # A generous budget keeps everything; a tiny one degrades to the title
+    assert budgeted_outline(long_pdf, Budget(seconds=60.0))[2] == FULL
+    assert budgeted_outline(long_pdf, Budget(seconds=1e-6))[2] == TITLE_ONLY
+    assert budgeted_outline(long_pdf, Budget(max_pages=5))[2] == PAGES_CAPPED
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+
+from heading_extractor import ENGINE_MODEL_PATH, MODEL_PATH
+from tree_engine import TreeEnsemble, _verification_features, export_booster, verify_against_booster
+
+xgboost = pytest.importorskip("xgboost")
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "input")
+ARRAYS = ("split_feature", "threshold", "left", "right", "default_left", "leaf_value", "roots")
+
+
+@pytest.fixture(scope="module")
+def booster():
+    return xgboost.Booster(model_file=MODEL_PATH)
+
+
+@pytest.fixture(scope="module")
+def ensemble():
+    return TreeEnsemble.load(ENGINE_MODEL_PATH)
+
+
+def test_committed_export_matches_native_model(booster, ensemble):
+    # A .npz left over from an earlier training run differs from a fresh export of the .ubj
+    fresh = export_booster(booster)
+    for name in ARRAYS:
+        np.testing.assert_array_equal(getattr(ensemble, name), getattr(fresh, name), err_msg=name)
+    assert ensemble.base_margin.view(np.uint32) == fresh.base_margin.view(np.uint32)
+    assert (ensemble.max_depth, ensemble.num_features) == (fresh.max_depth, fresh.num_features)
+
+
+def test_engine_matches_xgboost_on_sample_inputs(booster, ensemble):
+    report = verify_against_booster(booster, ensemble, _verification_features(ensemble, INPUT_DIR))
+    assert report["margin_mismatches"] == 0
+    assert report["label_mismatches"] == 0
+
+
+def test_stale_export_is_detected(booster):
+    # Trees exported from an earlier (here: shorter) booster no longer match the native model
+    stale = export_booster(booster[:booster.num_boosted_rounds() // 2])
+    report = verify_against_booster(booster, stale, _verification_features(stale, INPUT_DIR, n_random=1000))
+    assert report["margin_mismatches"] > 0
@@ -1,60 +1,218 @@
-
+import argparse
 import json
+import multiprocessing
+import os
+import time
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import GroupKFold, GroupShuffleSplit
 from xgboost import XGBClassifier
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 import joblib
+from heading_extractor import FEATURE_COLUMNS, best_booster
+from metrics import write_atomic
+from training_dataset import DEFAULT_DATASET_DIR, TrainingDataset
+from tree_engine import export_booster
+
+def model_params(n_estimators=100, n_jobs=None, tree_method="hist", max_bin=256, learning_rate=None,
+                 early_stopping_rounds=None):
+    # XGBClassifier arguments shared by the final fit and the cross-validation folds
+    params = {
+        "n_estimators": n_estimators,
+        "n_jobs": n_jobs,
+        "tree_method": tree_method,
+        "max_bin": max_bin,
+        "learning_rate": learning_rate,
+        "eval_metric": "logloss",
+    }
+    if early_stopping_rounds:
+        params["early_stopping_rounds"] = early_stopping_rounds
+    return params
+
+def export_native_model(model, native_output_path="xgboost_heading_model.ubj",
+                        engine_output_path="xgboost_heading_model.npz"):
+    # Save the booster in XGBoost's native format, plus the flat tree arrays that
+    # heading_extractor evaluates with tree_engine at runtime (no xgboost needed)
+    booster = best_booster(model)
+    booster.save_model(native_output_path)
+    print(f"Native model saved to {native_output_path}")
+    export_booster(booster).save(engine_output_path)
+    print(f"Tree engine model saved to {engine_output_path}")
+    return booster.num_boosted_rounds()
+
+def group_split(groups, test_size, random_state=42):
+    # Row positions of a random split by document, so no document has lines on both sides
+    return next(GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state)
+                .split(np.zeros(len(groups)), groups=groups))
+
+def fit_model(X, y, params, validation_size=0.1, init_model=None, groups=None):
+    # With early stopping, validation_size of the documents (given by groups) is held out
+    # to pick the number of trees
+    model = XGBClassifier(**params)
+    if params.get("early_stopping_rounds"):
+        fit_rows, valid_rows = group_split(groups, validation_size)
+        model.fit(X.iloc[fit_rows], y.iloc[fit_rows], eval_set=[(X.iloc[valid_rows], y.iloc[valid_rows])],
+                  verbose=False, xgb_model=init_model)
+    else:
+        model.fit(X, y, xgb_model=init_model)
+    return model
 
-def train_xgboost_model(data_path="training_data.json", model_output_path="xgboost_heading_model.joblib"):
-    with open(data_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    # Extract features and labels
-    features = []
-    labels = []
-    for item in data:
-        # For simplicity, using font_size and is_bold as features for now.
-        # More sophisticated features (relative position, indentation, etc.) can be added later.
-        features.append([
-            item["features"]["font_size"],
-            1 if item["features"]["is_bold"] else 0,
-            item["features"]["bbox"][0], # x0
-            item["features"]["bbox"][1], # y0
-            item["features"]["bbox"][2], # x1
-            item["features"]["bbox"][3], # y1
-            item["features"]["page_width"],
-            item["features"]["page_height"]
-        ])
-        labels.append(item["label"])
-
-    X = pd.DataFrame(features, columns=["font_size", "is_bold", "x0", "y0", "x1", "y1", "page_width", "page_height"])
+def score(y_true, y_pred):
+    return {
+        "accuracy": accuracy_score(y_true, y_pred),
+        "precision": precision_score(y_true, y_pred, zero_division=0),
+        "recall": recall_score(y_true, y_pred, zero_division=0),
+        "f1": f1_score(y_true, y_pred, zero_division=0),
+    }
+
+def load_warm_start(model_path):
+    # Previous classifier's trees (up to its best iteration) to continue boosting from
+    if not os.path.exists(model_path):
+        print(f"Warning: {model_path} not found, training from scratch")
+        return None
+    booster = best_booster(joblib.load(model_path))
+    print(f"Continuing from {model_path} ({booster.num_boosted_rounds()} trees)")
+    return booster
+
+def _cv_fold(task):
+    # Runs in a worker process; the fold reloads the memory-mapped dataset instead of receiving it
+    dataset_dir, fold, train_rows, test_rows, params, validation_size = task
+    features, labels, groups, _ = TrainingDataset(dataset_dir).load()
+    X = pd.DataFrame(features, columns=FEATURE_COLUMNS, copy=False)
     y = pd.Series(labels)
+    start = time.perf_counter()
+    model = fit_model(X.iloc[train_rows], y.iloc[train_rows], params, validation_size, groups=groups[train_rows])
+    result = score(y.iloc[test_rows], model.predict(X.iloc[test_rows]))
+    result.update({
+        "fold": fold,
+        "trees": best_booster(model).num_boosted_rounds(),
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+    return result
 
-    # Split data into training and testing sets
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+def cross_validate(dataset_dir, features, labels, groups, params, folds=5, workers=1, validation_size=0.1):
+    # Folds split by document, so no document has lines on both sides of a split;
+    # folds run in parallel processes that share the available threads
+    folds = min(folds, len(np.unique(groups)))
+    if folds < 2:
+        raise ValueError("Cross-validation needs at least 2 documents")
+    workers = max(1, min(workers, folds))
+    params = dict(params, n_jobs=max(1, (params.get("n_jobs") or os.cpu_count() or 1) // workers))
+    tasks = [
+        (dataset_dir, fold, train_rows, test_rows, params, validation_size)
+        for fold, (train_rows, test_rows) in enumerate(GroupKFold(n_splits=folds).split(features, labels, groups))
+    ]
+    if workers == 1:
+        results = [_cv_fold(task) for task in tasks]
+    else:
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            results = pool.map(_cv_fold, tasks)
+    for result in results:
+        print(f"Fold {result['fold']}: F1 {result['f1']:.4f}, precision {result['precision']:.4f}, "
+              f"recall {result['recall']:.4f}, {result['trees']} trees, {result['seconds']:.1f}s")
+    summary = {
+        name: {"mean": float(np.mean([r[name] for r in results])), "std": float(np.std([r[name] for r in results]))}
+        for name in ("accuracy", "precision", "recall", "f1")
+    }
+    print(f"Cross-validation F1: {summary['f1']['mean']:.4f} +/- {summary['f1']['std']:.4f} ({folds} folds)")
+    return {"folds": results, "summary": summary}
 
-    # Initialize and train XGBoost Classifier
-    model = XGBClassifier(use_label_encoder=False, eval_metric="logloss")
-    model.fit(X_train, y_train)
+def train_xgboost_model(dataset_dir=DEFAULT_DATASET_DIR, model_output_path="xgboost_heading_model.joblib",
+                        native_output_path="xgboost_heading_model.ubj", engine_output_path="xgboost_heading_model.npz",
+                        params=None, validation_size=0.1, warm_start=False, cv_folds=0, cv_workers=1,
+                        report_path=None):
+    start = time.perf_counter()
+    params = params or model_params()
+    # Features come straight from the memory-mapped dataset shards written by prepare_training_data.py
+    features, labels, groups, documents = TrainingDataset(dataset_dir).load()
+    if not documents:
+        raise ValueError(f"No training data in {dataset_dir}; run prepare_training_data.py first")
+    print(f"Loaded {len(labels)} lines from {len(documents)} documents")
 
-    # Evaluate the model
-    y_pred = model.predict(X_test)
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred)
-    recall = recall_score(y_test, y_pred)
-    f1 = f1_score(y_test, y_pred)
+    X = pd.DataFrame(features, columns=FEATURE_COLUMNS, copy=False)
+    y = pd.Series(labels)
 
-    print(f"Model Accuracy: {accuracy:.4f}")
-    print(f"Model Precision: {precision:.4f}")
-    print(f"Model Recall: {recall:.4f}")
-    print(f"Model F1-Score: {f1:.4f}")
+    cv = None
+    if cv_folds:
+        cv = cross_validate(dataset_dir, features, labels, groups, params, cv_folds, cv_workers, validation_size)
+
+    # The previous model is read before anything is written to model_output_path
+    init_model = load_warm_start(model_output_path) if warm_start else None
+
+    # Split data into training and testing sets by document
+    train_rows, test_rows = group_split(groups, 0.2)
+    X_train, X_test, y_train, y_test = X.iloc[train_rows], X.iloc[test_rows], y.iloc[train_rows], y.iloc[test_rows]
+
+    fit_start = time.perf_counter()
+    model = fit_model(X_train, y_train, params, validation_size, init_model, groups[train_rows])
+    fit_seconds = time.perf_counter() - fit_start
+
+    # Evaluate the model
+    test_scores = score(y_test, model.predict(X_test))
+    print(f"Model Accuracy: {test_scores['accuracy']:.4f}")
+    print(f"Model Precision: {test_scores['precision']:.4f}")
+    print(f"Model Recall: {test_scores['recall']:.4f}")
+    print(f"Model F1-Score: {test_scores['f1']:.4f}")
 
     # Save the trained model
     joblib.dump(model, model_output_path)
     print(f"Model saved to {model_output_path}")
+    trees = export_native_model(model, native_output_path, engine_output_path)
 
-if __name__ == "__main__":
-    train_xgboost_model()
+    wall_seconds = time.perf_counter() - start
+    sizes = {path: os.path.getsize(path) for path in (model_output_path, native_output_path, engine_output_path)}
+    print(f"Trained {trees} trees in {fit_seconds:.1f}s (total {wall_seconds:.1f}s); model sizes: "
+          + ", ".join(f"{os.path.basename(path)} {size / 1024:.1f} KiB" for path, size in sizes.items()))
 
+    if report_path:
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "dataset_dir": dataset_dir,
+            "documents": len(documents),
+            "lines": len(labels),
+            "params": params,
+            "warm_start": init_model is not None,
+            "trees": trees,
+            "fit_seconds": round(fit_seconds, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "model_bytes": sizes,
+            "test": test_scores,
+            "cross_validation": cv,
+        }
+        write_atomic(report_path, json.dumps(report, indent=2))
+        print(f"Training report written to {report_path}")
+    return model
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the XGBoost heading classifier")
+    parser.add_argument("--dataset-dir", default=DEFAULT_DATASET_DIR,
+                        help=f"Dataset built by prepare_training_data.py (default: {DEFAULT_DATASET_DIR})")
+    parser.add_argument("--threads", type=int, default=None, help="XGBoost threads (default: all cores)")
+    parser.add_argument("--tree-method", default="hist", choices=["hist", "approx", "exact"],
+                        help="XGBoost tree construction algorithm (default: hist)")
+    parser.add_argument("--max-bin", type=int, default=256, help="Histogram bins per feature (default: 256)")
+    parser.add_argument("--rounds", type=int, default=100,
+                        help="Boosting rounds; with --warm-start, rounds added to the existing model (default: 100)")
+    parser.add_argument("--learning-rate", type=float, default=None, help="Learning rate (default: XGBoost's)")
+    parser.add_argument("--early-stopping", type=int, default=None, metavar="ROUNDS",
+                        help="Stop once validation logloss has not improved for ROUNDS rounds")
+    parser.add_argument("--validation-size", type=float, default=0.1,
+                        help="Share of the training rows held out for early stopping (default: 0.1)")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="Continue boosting from the existing xgboost_heading_model.joblib")
+    parser.add_argument("--cv-folds", type=int, default=0,
+                        help="Run grouped-by-document cross-validation with this many folds first")
+    parser.add_argument("--cv-workers", type=int, default=1, help="Folds trained in parallel (default: 1)")
+    parser.add_argument("--report", default=None, help="Write a JSON training report to this path")
+    args = parser.parse_args()
 
+    train_xgboost_model(
+        args.dataset_dir,
+        params=model_params(args.rounds, args.threads, args.tree_method, args.max_bin, args.learning_rate,
+                            args.early_stopping),
+        validation_size=args.validation_size,
+        warm_start=args.warm_start,
+        cv_folds=args.cv_folds,
+        cv_workers=args.cv_workers,
+        report_path=args.report
+    )
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from heading_extractor import FEATURE_COLUMNS
+from layout_cache import cache_key, file_sha256
+from metrics import write_atomic
+
+DEFAULT_DATASET_DIR = "training_data"
+INDEX_NAME = "index.json"
+SHARDS_DIR = "shards"
+# One .npy file per column in every shard
+SHARD_COLUMNS = ("features", "labels", "pages")
+
+
+def shard_key(pdf_path: str, json_path: str) -> str:
+    # Changes whenever the PDF, its ground truth, PyMuPDF or the extractor changes
+    return hashlib.sha256(f"{cache_key(pdf_path)}:{file_sha256(json_path)}".encode()).hexdigest()
+
+
+def write_shard(dataset_dir: str, key: str, features: np.ndarray, labels: np.ndarray, pages: np.ndarray):
+    # Called from worker processes; the index is only updated by the parent
+    shards_dir = os.path.join(dataset_dir, SHARDS_DIR)
+    shard_dir = os.path.join(shards_dir, key)
+    if os.path.isdir(shard_dir):
+        return
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=shards_dir)
+    try:
+        np.save(os.path.join(tmp_dir, "features.npy"), np.ascontiguousarray(features, dtype=np.float64))
+        np.save(os.path.join(tmp_dir, "labels.npy"), np.ascontiguousarray(labels, dtype=np.int8))
+        np.save(os.path.join(tmp_dir, "pages.npy"), np.ascontiguousarray(pages, dtype=np.int32))
+        os.rename(tmp_dir, shard_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(shard_dir):
+            raise
+
+
+class TrainingDataset:
+    """
+    Columnar training set for the heading classifier, one shard per document.
+
+    Each shard is a directory of .npy columns: the feature matrix (one row per
+    line, FEATURE_COLUMNS order), the 0/1 heading labels and the page of every
+    line. Shards are keyed by the content of the PDF and its ground truth plus
+    the PyMuPDF/extractor version, so adding documents to the corpus only
+    extracts the new ones, and load() memory-maps the shards instead of parsing
+    per-line records.
+    """
+
+    def __init__(self, dataset_dir: str = DEFAULT_DATASET_DIR):
+        self.dataset_dir = dataset_dir
+        self.index_path = os.path.join(dataset_dir, INDEX_NAME)
+        self.documents = {}
+        self.dirty = False
+        os.makedirs(os.path.join(dataset_dir, SHARDS_DIR), exist_ok=True)
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                if index.get("feature_columns") == FEATURE_COLUMNS:
+                    self.documents = index.get("documents", {})
+            except (OSError, ValueError):
+                # Unreadable index: every document is extracted again
+                self.documents = {}
+
+    def shard_dir(self, key: str) -> str:
+        return os.path.join(self.dataset_dir, SHARDS_DIR, key)
+
+    def needs_update(self, pdf_file: str, key: str) -> bool:
+        entry = self.documents.get(pdf_file)
+        return entry is None or entry["key"] != key or not os.path.isdir(self.shard_dir(key))
+
+    def record(self, pdf_file: str, key: str, rows: int, headings: int):
+        self.documents[pdf_file] = {"key": key, "rows": rows, "headings": headings}
+        self.dirty = True
+
+    def forget(self, pdf_file: str):
+        if self.documents.pop(pdf_file, None) is not None:
+            self.dirty = True
+
+    def prune(self):
+        """Delete shards no document in the index refers to."""
+        live = {entry["key"] for entry in self.documents.values()}
+        shards_dir = os.path.join(self.dataset_dir, SHARDS_DIR)
+        for name in os.listdir(shards_dir):
+            if name not in live:
+                shutil.rmtree(os.path.join(shards_dir, name), ignore_errors=True)
+
+    def save(self):
+        if not self.dirty:
+            return
+        write_atomic(self.index_path, json.dumps({
+            "feature_columns": FEATURE_COLUMNS,
+            "documents": dict(sorted(self.documents.items()))
+        }, indent=2), prefix=".index-")
+        self.dirty = False
+
+    @property
+    def rows(self) -> int:
+        return sum(entry["rows"] for entry in self.documents.values())
+
+    def load_shard(self, key: str, mmap: bool = True) -> dict:
+        mmap_mode = "r" if mmap else None
+        return {
+            name: np.load(os.path.join(self.shard_dir(key), f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in SHARD_COLUMNS
+        }
+
+    def load(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[str]]:
+        """
+        Concatenate all shards in document order.
+
+        Returns:
+            features: float64 (n, len(FEATURE_COLUMNS))
+            labels: int8 (n,)
+            groups: int32 (n,), index into documents of the line's document
+            documents: PDF file names
+        """
+        documents = sorted(self.documents)
+        features = np.empty((self.rows, len(FEATURE_COLUMNS)), dtype=np.float64)
+        labels = np.empty(self.rows, dtype=np.int8)
+        groups = np.empty(self.rows, dtype=np.int32)
+        start = 0
+        for document_index, pdf_file in enumerate(documents):
+            shard = self.load_shard(self.documents[pdf_file]["key"])
+            end = start + len(shard["labels"])
+            # Shards are memory-mapped, so each one is copied straight into the output
+            features[start:end] = shard["features"]
+            labels[start:end] = shard["labels"]
+            groups[start:end] = document_index
+            start = end
+        if start != len(labels):
+            raise ValueError(f"Dataset index lists {len(labels)} rows but the shards hold {start}")
+        return features, labels, groups, documents
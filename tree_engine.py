@@ -0,0 +1,360 @@
+"""
+Pure-NumPy inference for the XGBoost heading classifier.
+
+The trees of a binary:logistic gbtree booster are exported once (this part
+needs xgboost) into flat arrays stored in an .npz file:
+    split_feature  feature index tested by each node
+    threshold      split threshold (float32); rows go left when x < threshold
+    left, right    global index of the child nodes (leaves point to themselves)
+    default_left   direction taken when the feature value is missing (NaN)
+    leaf_value     leaf output (float32, 0 for internal nodes)
+    roots          index of the root node of each tree
+
+Loading and evaluating the ensemble needs NumPy only. On load the node arrays
+are compiled into per-feature bitvector tables (the QuickScorer layout): each
+tree keeps a bitset of reachable leaves, every split a row fails removes the
+leaves of that split's left subtree, and the leftmost remaining leaf is the
+exit leaf. The failed splits of a feature are a prefix of its sorted
+thresholds, so a whole batch is scored with one searchsorted and one table
+gather per feature. Rows with missing values take a plain level-by-level
+traversal instead. Leaf values are accumulated in float32 in tree order like
+XGBoost's CPU predictor, so margins and labels match booster predictions
+exactly.
+
+Usage:
+    python tree_engine.py export xgboost_heading_model.ubj xgboost_heading_model.npz
+    python tree_engine.py verify xgboost_heading_model.ubj xgboost_heading_model.npz [pdf_dir]
+"""
+
+import json
+import sys
+
+import numpy as np
+
+ENGINE_FORMAT_VERSION = 1
+
+# Rows scored per step; keeps the (rows, n_trees) temporaries cache-sized
+BATCH_ROWS = 2048
+
+# Leaf bitsets with at most this many bits use a lookup table for the lowest set bit
+LOOKUP_TABLE_BITS = 16
+
+
+class TreeEnsemble:
+    """A gbtree ensemble stored as flat node arrays."""
+
+    def __init__(self, split_feature, threshold, left, right, default_left, leaf_value, roots,
+                 base_margin, max_depth, num_features):
+        self.split_feature = split_feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.base_margin = np.float32(base_margin)
+        self.max_depth = int(max_depth)
+        self.num_features = int(num_features)
+        self._compile()
+
+    def _compile(self):
+        n_nodes = len(self.threshold)
+        n_trees = len(self.roots)
+        node_ids = np.arange(n_nodes)
+        is_leaf = self.left == node_ids
+        tree_of_node = np.repeat(np.arange(n_trees), np.diff(np.append(self.roots, n_nodes)))
+
+        # Number leaves left to right within each tree and record, for each split,
+        # the bitset of leaves in its left subtree
+        leaf_position = np.zeros(n_nodes, dtype=np.int64)
+        left_subtree_bits = np.zeros(n_nodes, dtype=object)
+        leaf_counts = np.zeros(n_trees, dtype=np.int64)
+        for tree, root in enumerate(self.roots.tolist()):
+            stack = [(root, False)]
+            subtree_bits = {}
+            while stack:
+                node, children_done = stack.pop()
+                if is_leaf[node]:
+                    leaf_position[node] = leaf_counts[tree]
+                    subtree_bits[node] = 1 << int(leaf_counts[tree])
+                    leaf_counts[tree] += 1
+                elif children_done:
+                    left_bits = subtree_bits.pop(int(self.left[node]))
+                    left_subtree_bits[node] = left_bits
+                    subtree_bits[node] = left_bits | subtree_bits.pop(int(self.right[node]))
+                else:
+                    stack.append((node, True))
+                    stack.append((int(self.right[node]), False))
+                    stack.append((int(self.left[node]), False))
+
+        max_leaves = int(leaf_counts.max()) if n_trees else 1
+        self._bit_dtype = None
+        if max_leaves > 64:
+            # Too many leaves for a machine word: always use traversal
+            return
+        bits = next(b for b in (8, 16, 32, 64) if max_leaves <= b)
+        self._bit_dtype = np.dtype(f"uint{bits}")
+        all_leaves = (1 << bits) - 1
+
+        # Per feature: sorted thresholds and a (n_thresholds + 1, n_trees) table whose
+        # row k holds each tree's reachable leaves once the first k splits have failed
+        self._feature_tables = []
+        for feature in range(self.num_features):
+            nodes = np.flatnonzero(~is_leaf & (self.split_feature == feature))
+            if len(nodes) == 0:
+                continue
+            nodes = nodes[np.argsort(self.threshold[nodes], kind="stable")]
+            table = np.empty((len(nodes) + 1, n_trees), dtype=self._bit_dtype)
+            reachable = [all_leaves] * n_trees
+            table[0] = reachable
+            for row, node in enumerate(nodes.tolist(), start=1):
+                tree = tree_of_node[node]
+                reachable[tree] &= all_leaves ^ left_subtree_bits[node]
+                table[row] = reachable
+            self._feature_tables.append((feature, self.threshold[nodes], table))
+
+        # Leaf values laid out as [tree * leaf_stride + leaf position]
+        self._leaf_table = np.zeros(n_trees * bits, dtype=np.float32)
+        leaves = np.flatnonzero(is_leaf)
+        self._leaf_table[tree_of_node[leaves] * bits + leaf_position[leaves]] = self.leaf_value[leaves]
+        self._tree_offsets = np.arange(n_trees, dtype=np.int64) * bits
+        if bits <= LOOKUP_TABLE_BITS:
+            values = np.arange(1 << bits)
+            lowest_bits = (values & -values).astype(np.float64)
+            self._lowest_bit_lookup = np.maximum(np.frexp(lowest_bits)[1] - 1, 0)
+        else:
+            self._lowest_bit_lookup = None
+
+    @classmethod
+    def load(cls, path: str) -> "TreeEnsemble":
+        with np.load(path) as data:
+            if int(data["format_version"]) != ENGINE_FORMAT_VERSION:
+                raise ValueError(f"Unsupported tree engine model format in {path}")
+            return cls(
+                split_feature=data["split_feature"],
+                threshold=data["threshold"],
+                left=data["left"],
+                right=data["right"],
+                default_left=data["default_left"],
+                leaf_value=data["leaf_value"],
+                roots=data["roots"],
+                base_margin=data["base_margin"],
+                max_depth=data["max_depth"],
+                num_features=data["num_features"],
+            )
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            format_version=np.int32(ENGINE_FORMAT_VERSION),
+            split_feature=self.split_feature,
+            threshold=self.threshold,
+            left=self.left,
+            right=self.right,
+            default_left=self.default_left,
+            leaf_value=self.leaf_value,
+            roots=self.roots,
+            base_margin=self.base_margin,
+            max_depth=np.int32(self.max_depth),
+            num_features=np.int32(self.num_features),
+        )
+
+    def leaf_indices(self, feature_matrix: np.ndarray) -> np.ndarray:
+        # (n_rows, n_trees) index of the leaf each row reaches in each tree
+        x = np.ascontiguousarray(feature_matrix, dtype=np.float32)
+        n_rows = x.shape[0]
+        flat_x = x.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int64) * self.num_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_rows, len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            values = flat_x[row_offsets + self.split_feature[nodes]]
+            go_left = values < self.threshold[nodes]
+            missing = np.isnan(values)
+            if missing.any():
+                go_left = np.where(missing, self.default_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def _exit_leaf_values(self, x: np.ndarray) -> np.ndarray:
+        # (n_rows, n_trees) value of the leaf each row reaches, via the bitvector tables
+        reachable = None
+        for feature, thresholds, table in self._feature_tables:
+            # Splits with threshold <= x fail (rows go right)
+            failed = np.searchsorted(thresholds, x[:, feature], side="right")
+            rows = table[failed]
+            if reachable is None:
+                reachable = rows
+            else:
+                reachable &= rows
+        if reachable is None:
+            reachable = np.ones((len(x), len(self.roots)), dtype=self._bit_dtype)
+        if self._lowest_bit_lookup is not None:
+            exit_leaf = self._lowest_bit_lookup[reachable]
+        else:
+            lowest_bit = reachable & (~reachable + self._bit_dtype.type(1))
+            # Powers of two are exact in float32; read the position from the exponent
+            exit_leaf = (lowest_bit.astype(np.float32).view(np.int32) >> 23) - 127
+        return self._leaf_table[exit_leaf + self._tree_offsets]
+
+    def predict_margin(self, feature_matrix: np.ndarray) -> np.ndarray:
+        x = np.ascontiguousarray(feature_matrix, dtype=np.float32)
+        margin = np.full(x.shape[0], self.base_margin, dtype=np.float32)
+        for start in range(0, x.shape[0], BATCH_ROWS):
+            batch = x[start:start + BATCH_ROWS]
+            if self._bit_dtype is None or np.isnan(batch).any():
+                leaf_values = self.leaf_value[self.leaf_indices(batch)]
+            else:
+                leaf_values = self._exit_leaf_values(batch)
+            # Sum tree by tree in float32, in the same order as XGBoost
+            batch_margin = margin[start:start + BATCH_ROWS]
+            for tree_values in leaf_values.T:
+                batch_margin += tree_values
+        return margin
+
+    def predict_proba(self, feature_matrix: np.ndarray) -> np.ndarray:
+        margin = self.predict_margin(feature_matrix)
+        one = np.float32(1.0)
+        return one / (one + np.exp(-margin))
+
+
+class TreeEngineModel:
+    # Same interface as heading_extractor.BoosterModel, backed by a TreeEnsemble
+    def __init__(self, ensemble: TreeEnsemble):
+        self.ensemble = ensemble
+
+    def predict(self, feature_matrix: np.ndarray) -> np.ndarray:
+        return (self.ensemble.predict_proba(feature_matrix) > 0.5).astype(np.int64)
+
+    def set_threads(self, n_threads: int):
+        # NumPy evaluation runs on the calling thread only
+        pass
+
+
+def export_booster(booster) -> TreeEnsemble:
+    """Convert a binary:logistic gbtree xgboost.Booster into a TreeEnsemble."""
+    model = json.loads(booster.save_raw("json"))
+    learner = model["learner"]
+    if learner["objective"]["name"] != "binary:logistic":
+        raise ValueError(f"Unsupported objective: {learner['objective']['name']}")
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise ValueError(f"Unsupported booster: {gbm['name']}")
+    trees = gbm["model"]["trees"]
+
+    split_feature, threshold, left, right, default_left, leaf_value, roots = [], [], [], [], [], [], []
+    max_depth = 0
+    offset = 0
+    for tree in trees:
+        if any(tree["split_type"]):
+            raise ValueError("Categorical splits are not supported")
+        tree_left = np.asarray(tree["left_children"], dtype=np.int64)
+        tree_right = np.asarray(tree["right_children"], dtype=np.int64)
+        is_leaf = tree_left == -1
+        node_ids = np.arange(len(tree_left), dtype=np.int64)
+        # Leaves point to themselves so extra traversal steps are no-ops
+        left.append(np.where(is_leaf, node_ids, tree_left) + offset)
+        right.append(np.where(is_leaf, node_ids, tree_right) + offset)
+        split_feature.append(np.where(is_leaf, 0, np.asarray(tree["split_indices"], dtype=np.int64)))
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        threshold.append(np.where(is_leaf, np.float32(np.inf), conditions))
+        # For leaves, split_conditions holds the leaf value
+        leaf_value.append(np.where(is_leaf, conditions, np.float32(0)))
+        default_left.append(np.asarray(tree["default_left"], dtype=bool))
+        roots.append(offset)
+        max_depth = max(max_depth, _tree_depth(tree_left, tree_right))
+        offset += len(tree_left)
+
+    # base_score is stored as a probability; XGBoost starts from its logit, computed in float32
+    base_score = np.float32(float(learner["learner_model_param"]["base_score"]))
+    base_margin = np.float32(-np.log(np.float64(np.float32(np.float32(1.0) / base_score - np.float32(1.0)))))
+
+    index_dtype = np.int32 if offset < 2 ** 31 else np.int64
+    return TreeEnsemble(
+        split_feature=np.concatenate(split_feature).astype(np.int32),
+        threshold=np.concatenate(threshold).astype(np.float32),
+        left=np.concatenate(left).astype(index_dtype),
+        right=np.concatenate(right).astype(index_dtype),
+        default_left=np.concatenate(default_left),
+        leaf_value=np.concatenate(leaf_value).astype(np.float32),
+        roots=np.asarray(roots, dtype=index_dtype),
+        base_margin=base_margin,
+        max_depth=max_depth,
+        num_features=int(learner["learner_model_param"]["num_feature"]),
+    )
+
+
+def _tree_depth(left, right) -> int:
+    depth = 0
+    level = [0]
+    while level:
+        next_level = [child for node in level for child in (left[node], right[node]) if child != -1]
+        if next_level:
+            depth += 1
+        level = next_level
+    return depth
+
+
+def verify_against_booster(booster, ensemble: TreeEnsemble, feature_matrix: np.ndarray) -> dict:
+    """Compare engine and xgboost predictions on a feature matrix; returns mismatch counts."""
+    margin_xgb = booster.inplace_predict(feature_matrix, predict_type="margin")
+    proba_xgb = booster.inplace_predict(feature_matrix)
+    margin_engine = ensemble.predict_margin(feature_matrix)
+    proba_engine = ensemble.predict_proba(feature_matrix)
+    return {
+        "rows": int(len(feature_matrix)),
+        "margin_mismatches": int(np.count_nonzero(margin_xgb.view(np.uint32) != margin_engine.view(np.uint32))),
+        "label_mismatches": int(np.count_nonzero((proba_xgb > 0.5) != (proba_engine > 0.5))),
+        "max_proba_difference": float(np.max(np.abs(proba_xgb - proba_engine))) if len(feature_matrix) else 0.0,
+    }
+
+
+def _verification_features(ensemble: TreeEnsemble, pdf_dir: str | None, n_random: int = 200000) -> np.ndarray:
+    # Features from real PDFs plus random rows, including values placed exactly on split thresholds
+    rng = np.random.default_rng(0)
+    parts = []
+    if pdf_dir:
+        import os
+        from pdf_processor import extract_text_with_layout
+        from heading_extractor import build_feature_matrix
+        for name in sorted(os.listdir(pdf_dir)):
+            if name.lower().endswith(".pdf"):
+                parts.append(build_feature_matrix(extract_text_with_layout(os.path.join(pdf_dir, name))))
+    random_rows = np.column_stack([
+        rng.uniform(4, 40, n_random),                   # font_size
+        rng.integers(0, 2, n_random),                   # is_bold
+        rng.uniform(0, 612, (n_random, 4)),             # bbox
+        rng.choice([595.0, 612.0, 842.0], n_random),    # page_width
+        rng.choice([792.0, 842.0, 595.0], n_random),    # page_height
+    ])
+    internal = ensemble.threshold != np.inf
+    nodes = rng.choice(np.flatnonzero(internal), n_random)
+    random_rows[np.arange(n_random), ensemble.split_feature[nodes]] = ensemble.threshold[nodes]
+    # A few missing values to exercise default directions
+    random_rows[rng.random(random_rows.shape) < 0.01] = np.nan
+    parts.append(random_rows)
+    return np.vstack(parts)
+
+
+def main():
+    if len(sys.argv) < 4 or sys.argv[1] not in ("export", "verify"):
+        print(__doc__)
+        sys.exit(1)
+
+    import xgboost
+    booster = xgboost.Booster(model_file=sys.argv[2])
+    if sys.argv[1] == "export":
+        ensemble = export_booster(booster)
+        ensemble.save(sys.argv[3])
+        print(f"Exported {len(ensemble.roots)} trees ({len(ensemble.threshold)} nodes, depth {ensemble.max_depth}) to {sys.argv[3]}")
+        return
+
+    ensemble = TreeEnsemble.load(sys.argv[3])
+    pdf_dir = sys.argv[4] if len(sys.argv) > 4 else None
+    report = verify_against_booster(booster, ensemble, _verification_features(ensemble, pdf_dir))
+    print(json.dumps(report, indent=2))
+    if report["margin_mismatches"] or report["label_mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()